@@ -0,0 +1,142 @@
+# times INIFile against the old per line parser, run from the repository root:
+# python -m benchmarks.inifile_parse [--sections N] [--repeat N]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from pyfl_utils.inifile import INIFile
+from pyfl_utils.multidict import MultiDict
+
+
+def write_synthetic_ini(path, sections, seed=0):
+    # system and market style sections, including comments, repeated keys and the odd lines
+    # the parser has to keep handling the same way
+    rng = random.Random(seed)
+    lines = ['; synthetic ini', '']
+
+    for i in range(sections):
+        lines.append('[{}]'.format(rng.choice(['Object', 'zone', 'Ship', 'MarketGood', 'Base'])) + (' ; c' if i % 97 == 0 else ''))
+        lines.append('nickname = obj_{}'.format(i))
+        lines.append('  pos = {:f}, {:f}, {:f}  ; position'.format(rng.random(), rng.random(), rng.random()))
+        lines.append('rotate=0,90,0')
+        lines.append('ids_name = {}'.format(rng.randint(0, 1 << 20)))
+        lines.append('; a comment line')
+        lines.append('archetype = arch_{}'.format(i % 50))
+        lines.append('flag')
+        lines.append('weird = a = b ; x')
+        lines.append('\tmarket_good = item_{}, 1, -1, 10, 10, 0, 1'.format(i))
+        lines.append('market_good = item_{}, 1, -1, 10, 10, 0, 1'.format(i + 1))
+        lines.append('')
+
+    with open(path, 'w', newline='') as file:
+        file.write('\r\n'.join(lines))
+
+
+class _PerLineSection(object):
+    # the section side of the parser INIFile used before the single pass scanner
+    def __init__(self, section_name):
+        self.name = section_name
+        self._options = MultiDict()
+
+    @staticmethod
+    def _strip_comments(string):
+        return string.split(';')[0].strip()
+
+    def _add_raw(self, line):
+        if not line.startswith(';'):
+            split = line.split('=')
+
+            if len(split) == 1:
+                split.append('')
+
+            if split[0] != '':
+                self._options[split[0].strip()] = self._strip_comments(split[1])
+
+
+def parse_per_line(path):
+    # the parser INIFile used before the single pass scanner, as the reference
+    with open(path, 'rb') as file:
+        raw = file.read().decode('UTF-8', errors='replace')
+
+    sections = MultiDict()
+    current_section = None
+
+    for line in raw.split('\n'):
+        line = line.replace('\n', '')
+        line = line.replace('\r', '')
+        line = line.strip('\r\n \t')
+
+        if line == '' or line.startswith(';'):
+            continue
+
+        if line.startswith('BINI'):
+            break
+
+        if line.startswith('['):
+            line = line.strip('[]')
+            current_section = _PerLineSection(line)
+            sections[line.lower()] = current_section
+        elif current_section is None:
+            raise Exception('error parsing ini: floating config!')
+        else:
+            current_section._add_raw(line)
+
+    return sections
+
+
+def check_same_sections(reference, ini):
+    # the reference groups the sections by name while INIFile keeps the file order, so they are
+    # compared name by name. within a section both keep the options by key in first seen order.
+    count = 0
+    
+    for name, sections in reference.items():
+        if not isinstance(sections, list):
+            sections = [sections]
+        parsed = ini.get_all(name)
+        assert [section.name for section in parsed] == [section.name for section in sections], name
+        
+        for old, new in zip(sections, parsed):
+            options = MultiDict()
+            for key, value in new._options.items():
+                options[key] = value
+            assert options == old._options, (name, list(old._options.items()), list(options.items()))
+        count += len(sections)
+        
+    assert count == len(ini.to_list())
+    
+    
+def best_times(functions, repeat):
+    # the functions take turns, so a slow phase of the machine hits all of them alike
+    best = [None] * len(functions)
+    for _ in range(repeat):
+        for i, function in enumerate(functions):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='times INIFile parsing of a large synthetic ini')
+    parser.add_argument('--sections', type=int, default=40000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.ini')
+        write_synthetic_ini(path, args.sections)
+
+        size = os.path.getsize(path)
+        check_same_sections(parse_per_line(path), INIFile(path))
+        reference, current = best_times([lambda: parse_per_line(path), lambda: INIFile(path)], args.repeat)
+
+    print('{} sections, {:.1f} MB'.format(args.sections, size / 1024 / 1024))
+    print('per line reference  {:.3f}s'.format(reference))
+    print('INIFile             {:.3f}s  ({:.1f}x)'.format(current, reference / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import re
 import logging
 import struct
 from collections import namedtuple, defaultdict
@@ -5,139 +6,280 @@ from collections import namedtuple, defaultdict
 _logger = logging.getLogger(__name__)
 
 
+_header_struct = struct.Struct('<4sii')
+_section_struct = struct.Struct('<hh')
+_entry_struct = struct.Struct('<hb')
+_value_struct = struct.Struct('<bi')
+_float_struct = struct.Struct('<f')
+_float_value_struct = struct.Struct('<bf')
+
+# the shared values are dropped above this many while streaming, see BINI.iter_sections
+_STREAM_VALUES_CACHE_SIZE = 4096
+
+_int_pattern = re.compile(r'[-+]?\d+$')
+_float_pattern = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+
+
 class BINI(object):
     HEADER = namedtuple('BiniHeader', ['format', 'version', 'string_table_offset'])
     SECTION = namedtuple('BiniSection', ['stp', 'num_entries'])
     ENTRY = namedtuple('BiniEntry', ['stp', 'num_values'])
     VALUE = namedtuple('BiniValue', ['value_type', 'value'])
         
-    def __init__(self, content):
+    def __init__(self, content, lazy=False):
         # try:
         #    content = content.encode('cp1252')
         # except:
         #   pass
 
+        # lazy only locates the sections, their entries are decoded by get_section on first use
         self._raw = content
+        self._view = memoryview(content)
+        self._lazy = lazy
                 
         self._string_table = defaultdict(str)
+        self._values_cache = {}
         self._read_offset = 0
         
         self._sections = []  
+        self._section_offsets = []
         
         self._decode()
+        
+        if not lazy:
+            self._view.release()
+            self._values_cache = None
     
     def _decode(self):
         self._decode_header()
         self._decode_string_table()
         
-        self._decode_sections()        
+        if self._lazy:
+            self._index_sections()
+        else:
+            self._decode_sections()        
     
     def _decode_header(self):
-        self.header = self.HEADER(
-            self._raw[0:4],
-            struct.unpack('i', self._raw[4:8])[0],
-            struct.unpack('i', self._raw[8:12])[0],
-        )
-        self._read_offset = 12
+        self.header = self.HEADER(*_header_struct.unpack_from(self._view, 0))
+        self._read_offset = _header_struct.size
         
     def _decode_sections(self):
-        while self._read_offset < self.header.string_table_offset:
-            section_header = self._decode_section_header()
-            
-            section_dict = {
-                'name': self._string_table[section_header.stp],
-                'entries': [],
-            }
-                        
-            for i in range(section_header.num_entries):
-                entry_dict = self._decode_entry()
-                section_dict['entries'].append(entry_dict)
-            
-            self._sections.append(section_dict)
-            
-    def _decode_entry(self):
-        section_entry = self._decode_entry_header()
-        
-        entry_dict = {
-            'name': self._string_table[section_entry.stp],
-            'values': []
-        }
-        
-        for i in range(section_entry.num_values):
-            entry_value = self._decode_value()
-            entry_dict['values'].append(entry_value)
-                
-        return entry_dict
-        
-    def _decode_section_header(self):
         ro = self._read_offset
-    
-        section_header = self.SECTION(
-            struct.unpack('h', self._raw[ro:ro + 2])[0],
-            struct.unpack('h', self._raw[ro + 2:ro + 4])[0],
-        )
         
-        self._read_offset = ro + 4
-        return section_header
+        while ro < self.header.string_table_offset:
+            self._section_offsets.append(ro)
+            section_dict, ro = self._decode_section(ro)
+            self._sections.append(section_dict)
+            
+        self._read_offset = ro
         
-    def _decode_entry_header(self):
+    def _index_sections(self):
+        # walks the entry headers only, the values are skipped
+        view = self._view
         ro = self._read_offset
         
-        entry = self.ENTRY(
-            struct.unpack('h', self._raw[ro:ro + 2])[0],
-            struct.unpack('b', self._raw[ro + 2: ro + 3])[0],
-        )
-        
-        self._read_offset = ro + 3
-        return entry
+        while ro < self.header.string_table_offset:
+            self._section_offsets.append(ro)
+            
+            _, num_entries = _section_struct.unpack_from(view, ro)
+            ro += _section_struct.size
+            
+            for _ in range(num_entries):
+                _, num_values = _entry_struct.unpack_from(view, ro)
+                ro += _entry_struct.size + num_values * _value_struct.size
+                
+        self._sections = [None] * len(self._section_offsets)
+        self._read_offset = ro
         
-    def _decode_value(self):
-        ro = self._read_offset
-        self._read_offset = ro + 5
+    def _decode_section(self, ro):
+        # returns the section at ro and the offset behind it. this runs for every value of the
+        # file, so everything is kept local. values are immutable and repeat a lot, so they are
+        # shared by their raw (type, int) record.
+        view = self._view
+        string_table = self._string_table
+        make_value = self.VALUE._make
+        values_cache = self._values_cache
         
-        val_type = struct.unpack('b', self._raw[ro:ro + 1])[0]
+        section_stp, num_entries = _section_struct.unpack_from(view, ro)
+        ro += _section_struct.size
         
-        if val_type == 0x01:
-            val_content = struct.unpack('i', self._raw[ro + 1:ro + 5])[0]
-        elif val_type == 0x02:
-            val_content = struct.unpack('f', self._raw[ro + 1:ro + 5])[0]
-        elif val_type == 0x03:
-            val_content = struct.unpack('i', self._raw[ro + 1:ro + 5])[0]
-            val_content = self._string_table[val_content]            
-        else:
-            _logger.error('invalid value type {}'.format(val_type))
-            return self.VALUE(
-                val_type,
-                None
-            )
-        
-        val = self.VALUE(
-            val_type,
-            val_content,
-        )
-        
-        return val
+        entries = []
+        for _ in range(num_entries):
+            entry_stp, num_values = _entry_struct.unpack_from(view, ro)
+            ro += _entry_struct.size
+            
+            values = []
+            for raw_value in _value_struct.iter_unpack(view[ro:ro + num_values * _value_struct.size]):
+                value = values_cache.get(raw_value)
+                
+                if value is None:
+                    val_type = raw_value[0]
+                    
+                    if val_type == 0x01:
+                        value = make_value(raw_value)
+                    elif val_type == 0x02:
+                        value = make_value((val_type, _float_struct.unpack_from(view, ro + 1)[0]))
+                    elif val_type == 0x03:
+                        value = make_value((val_type, string_table[raw_value[1]]))
+                    else:
+                        _logger.error('invalid value type {}'.format(val_type))
+                        value = make_value((val_type, None))
+                        
+                    values_cache[raw_value] = value
+                    
+                values.append(value)
+                ro += _value_struct.size
+                
+            entries.append({
+                'name': string_table[entry_stp],
+                'values': values,
+            })
+            
+        section_dict = {
+            'name': string_table[section_stp],
+            'entries': entries,
+        }
+        return section_dict, ro
     
     def _decode_string_table(self):
         if not self.header.string_table_offset:
             _logger.error('no string table offset!')
             return
             
-        pos = self.header.string_table_offset
-        st_offseet = self.header.string_table_offset
-        
-        current_string = ''
+        # only terminated strings are part of the table, the last split part never is
         str_offset = 0
-        while pos < len(self._raw):
-            if self._raw[pos] == 0:
-                # logger.debug('string table offset {}: "{}"'.format(str_offset, current_string))
-                self._string_table[str_offset] = current_string
-                current_string = ''
-                str_offset = (pos - st_offseet) + 1
-            else:
-                current_string += chr(self._raw[pos])
-                
-            pos += 1
+        for string in bytes(self._view[self.header.string_table_offset:]).split(b'\x00')[:-1]:
+            self._string_table[str_offset] = string.decode('latin-1')
+            str_offset += len(string) + 1
+    
+    def get_section_names(self):
+        return [
+            self._string_table[_section_struct.unpack_from(self._raw, offset)[0]] 
+            for offset in self._section_offsets
+        ]
+        
+    def get_section(self, index, cache=True):
+        # without cache a lazy section is decoded for the caller only, e.g. when it is copied anyway
+        section_dict = self._sections[index]
+        
+        if section_dict is None:
+            section_dict, _ = self._decode_section(self._section_offsets[index])
+            if cache:
+                self._sections[index] = section_dict
+            
+        return section_dict
     
     def get_sections(self):
+        if self._lazy:
+            for index in range(len(self._sections)):
+                self.get_section(index)
         return self._sections
+        
+    def iter_sections(self, names=None):
+        # lazy only, decodes the sections one after another without keeping them. names limits
+        # them to a set of lowercase section names, other sections are not decoded at all.
+        string_table = self._string_table
+        values_cache = self._values_cache
+        
+        for offset in self._section_offsets:
+            if len(values_cache) > _STREAM_VALUES_CACHE_SIZE:
+                values_cache.clear()
+                
+            if names is not None:
+                section_stp, _ = _section_struct.unpack_from(self._view, offset)
+                if string_table[section_stp].lower() not in names:
+                    continue
+                    
+            section_dict, _ = self._decode_section(offset)
+            yield section_dict
+            
+    def release(self):
+        # frees the view on the content, e.g. before closing an mmap it was created from
+        self._view.release()
+
+
+class BINIWriter(object):
+    # encodes sections in the format of BINI.get_sections(), values are (type, value) pairs
+    def __init__(self, sections):
+        self._sections = sections
+        
+        self._string_offsets = {}
+        self._string_parts = []
+        self._string_table_length = 0
+        
+    @staticmethod
+    def values_from_string(string):
+        # types the comma separated values of a text ini the way the game does: int, float or string
+        values = []
+        
+        for value in string.split(','):
+            value = value.strip()
+            
+            if _int_pattern.match(value) and -0x80000000 <= int(value) <= 0x7fffffff:
+                values.append(BINI.VALUE(0x01, int(value)))
+            elif _float_pattern.match(value):
+                values.append(BINI.VALUE(0x02, float(value)))
+            else:
+                values.append(BINI.VALUE(0x03, value))
+                
+        if values == [BINI.VALUE(0x03, '')]:
+            return []
+        return values
+        
+    def encode(self):
+        # section and entry names only have 16 bit pointers, so they go first into the string table
+        for section in self._sections:
+            self._name_pointer(section['name'])
+            for entry in section['entries']:
+                self._name_pointer(entry['name'])
+                
+        body = bytearray()
+        for section in self._sections:
+            entries = section['entries']
+            if len(entries) > 0x7fff:
+                raise Exception('too many entries in section "{}"'.format(section['name']))
+                
+            body += _section_struct.pack(self._name_pointer(section['name']), len(entries))
+            
+            for entry in entries:
+                values = entry['values']
+                if len(values) > 0x7f:
+                    raise Exception('too many values for "{}"'.format(entry['name']))
+                    
+                body += _entry_struct.pack(self._name_pointer(entry['name']), len(values))
+                
+                for val_type, value in values:
+                    if val_type == 0x01:
+                        body += _value_struct.pack(val_type, value)
+                    elif val_type == 0x02:
+                        body += _float_value_struct.pack(val_type, value)
+                    elif val_type == 0x03:
+                        body += _value_struct.pack(val_type, self._string_pointer(value))
+                    else:
+                        raise Exception('invalid value type {}'.format(val_type))
+                        
+        header = _header_struct.pack(b'BINI', 1, _header_struct.size + len(body))
+        return b''.join([header, body] + self._string_parts)
+        
+    def save(self, filename):
+        with open(filename, 'wb') as file:
+            file.write(self.encode())
+        
+    def _name_pointer(self, string):
+        pointer = self._string_pointer(string)
+        if pointer > 0x7fff:
+            raise Exception('string table too large for name "{}"'.format(string))
+        return pointer
+        
+    def _string_pointer(self, string):
+        pointer = self._string_offsets.get(string)
+        
+        if pointer is None:
+            encoded = string.encode('latin-1', errors='replace') + b'\x00'
+            pointer = self._string_table_length
+            
+            self._string_parts.append(encoded)
+            self._string_table_length += len(encoded)
+            self._string_offsets[string] = pointer
+            
+        return pointer
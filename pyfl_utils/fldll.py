@@ -27,7 +27,7 @@ class FLDll(object):
             section = ini_file.get('resources')
             
             if section:
-                dlls = section.get('DLL')
+                dlls = section.get_all('DLL')
                 self._dll_base_index = dlls.index(base) + 1
         elif base_index:
             self._dll_base_index = base_index
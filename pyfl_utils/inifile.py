@@ -1,16 +1,24 @@
-import codecs
 import logging
+import mmap
 import os
-from .multidict import MultiDict
-from .bini import BINI
+import sys
+from itertools import compress
+from .multidict import OrderedMultiDict
+from .bini import BINI, BINIWriter
 
 _logger = logging.getLogger(__name__)
 
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
 
 class INIFile(object):
-    def __init__(self, filename):
-        self._sections = MultiDict()
+    def __init__(self, filename, lazy=False):
+        # lazy only applies to BINI files, each section is decoded when it is first used
+        self._sections = OrderedMultiDict()    # lowercased section name -> sections
+        self._indexes = {}  # key -> _SectionIndex, see add_index
+        self._order = None  # section -> position in the file, see _section_order
         self._filename = filename
+        self._lazy = lazy
         
         with open(filename, 'rb') as file:
             try:
@@ -22,6 +30,9 @@ class INIFile(object):
         is_bini = self._parse_bini()        
         if not is_bini:
             self._parse_raw()
+            
+        # everything is parsed now (a lazy BINI keeps its own reference)
+        self._raw = None
 
         _logger.debug(filename)
         
@@ -34,61 +45,193 @@ class INIFile(object):
 
     def _parse_bini(self):
         if self._is_bini():
-            bini = BINI(self._raw)
+            bini = BINI(self._raw, lazy=self._lazy)
             
-            for section in bini.get_sections():
-                ini_section = IniSection(section['name'])
-                
-                for entry in section['entries']:
-                    vals = []
-                    for value in entry['values']:         
-                        vals.append(str(value.value))
-                        
-                    ini_section.add(entry['name'], ', '.join(vals))
+            for index, name in enumerate(bini.get_section_names()):
+                if self._lazy:
+                    ini_section = IniSection(name, loader=lambda section, index=index: self._load_bini_section(section, bini.get_section(index, cache=False)))
+                else:
+                    ini_section = IniSection(name)
+                    self._load_bini_section(ini_section, bini.get_section(index))
                 
                 self.add(ini_section)            
             return True
         return False
+        
+    @staticmethod
+    def _load_bini_section(ini_section, section):
+        for entry in section['entries']:
+            vals = []
+            for value in entry['values']:         
+                vals.append(str(value.value))
+                
+            ini_section._add_bini(entry['name'], ', '.join(vals), entry['values'])
     
     def _parse_raw(self):
         self._raw = self._raw.decode('UTF-8', errors='replace')
+        
+        for section in self._iter_raw_sections(self._raw.replace('\r', '').split('\n')):
+            self._sections.add(section.name.lower(), section)
+            
+    @staticmethod
+    def iter_sections(path, names=None):
+        # yields the sections of a text or BINI ini one at a time as they are read, neither the file
+        # nor the sections are kept. names limits them to those section names.
+        if names is not None:
+            if isinstance(names, str):
+                names = [names]
+            names = {name.lower() for name in names}
+            
+        with open(path, 'rb') as file:
+            if file.read(4) == b'BINI':
+                yield from INIFile._iter_bini_sections(file, names)
+            else:
+                file.seek(0)
+                lines = (line.decode('UTF-8', errors='replace').replace('\r', '') for line in file)
+                yield from INIFile._iter_raw_sections(lines, names)
+                
+    @staticmethod
+    def _iter_bini_sections(file, names):
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            bini = BINI(mapped, lazy=True)
+            
+            try:
+                for section in bini.iter_sections(names):
+                    ini_section = IniSection(section['name'])
+                    INIFile._load_bini_section(ini_section, section)
+                    yield ini_section
+            finally:
+                bini.release()
+                
+    @staticmethod
+    def _iter_raw_sections(lines, names=None):
+        # single pass over the lines, key/value lines are split right here. the value ends at the
+        # next '=' or ';'. the options of a section are stored in one go and the section is
+        # yielded once the next section starts. sections not in names are skipped.
         current_section = None
-        for line in self._raw.split('\n'):
-            line = line.replace('\n', '')
-            line = line.replace('\r', '')
-            line = line.strip('\r\n \t')
+        skipping = False
+        items = []
+        
+        for line in lines:
+            line = line.strip(' \t\n')
             
-            if line == '' or line.startswith(';'):
+            if not line:
+                continue
+                
+            first = line[0]
+            if first == ';':
                 continue
                 
-            if line.startswith('BINI'):
+            if first == 'B' and line.startswith('BINI'):
                 _logger.error('this is a bini file!!')
-                return
+                break
                             
-            if line.startswith('['):
+            if first == '[':
+                if current_section is not None:
+                    if items:
+                        current_section._options.extend(items)
+                        items = []
+                    yield current_section
+                    
                 line = line.strip('[]')
-                current_section = IniSection(line)
-                self._sections[line.lower()] = current_section
-            elif not current_section:
+                if names is None or line.lower() in names:
+                    current_section = IniSection(line)
+                else:
+                    current_section = None
+                    skipping = True
+                continue
+                
+            if current_section is None:
+                if skipping:
+                    continue
                 raise Exception('error parsing ini: floating config!')
-            else:
-                current_section._add_raw(line)
+                
+            key, _, value = line.partition('=')
+            if not key:
+                continue
+                
+            value = value.partition(';')[0]
+            if '=' in value:
+                value = value.partition('=')[0]
+                
+            items.append((key.strip(), value.strip()))
+            
+        if current_section is not None:
+            if items:
+                current_section._options.extend(items)
+            yield current_section
     
     def print_raw(self):
-        for section in self.to_list():
+        for section in self._sections.values():
             section.print_raw()
             
     def get(self, section_name):
-        try:
-            return self._sections[section_name.lower()]
-        except KeyError:
+        # the section, or a list if there are several of that name
+        sections = self.get_all(section_name)
+        
+        if not sections:
             return None
+        if len(sections) == 1:
+            return sections[0]
+        return sections
+        
+    def get_all(self, section_name):
+        return self._sections.get_all(section_name.lower())
+        
+    def add_index(self, key):
+        # keeps the sections by the lowercased values of key, get_by_key and get_by_kv on that key
+        # become dictionary lookups instead of scanning every section
+        if key in self._indexes:
+            return
+            
+        index = _SectionIndex(key)
+        for section in self._sections.values():
+            section._ini = self
+            index.add(section)
+        self._indexes[key] = index
+        
+    def _update_indexes(self, section, key):
+        index = self._indexes.get(key)
+        if index is not None and section in self._section_order():
+            index.add(section)
+            
+    def _index_section(self, section):
+        section._ini = self
+        for index in self._indexes.values():
+            index.add(section)
+            
+    def _unindex_section(self, section):
+        section._ini = None
+        for index in self._indexes.values():
+            index.remove(section)
+            
+    def _section_order(self):
+        # the indexes keep sections in the order they were indexed, their hits are sorted by this.
+        # removing or appending sections keeps the relative order, so it is only rebuilt after set.
+        if self._order is None:
+            self._order = {section: position for position, section in enumerate(self._sections.values())}
+        return self._order
+        
+    def _filter_indexed(self, sections, multiple, section_name):
+        if len(sections) > 1:
+            sections.sort(key=self._section_order().__getitem__)
+            
+        if section_name:
+            section_name = section_name.lower()
+            sections = [section for section in sections if section.name.lower() == section_name]
+            
+        if multiple:
+            return sections
+        return sections[0] if sections else None
         
     def get_by_key(self, key, multiple=True, section_name=None):
+        if key in self._indexes:
+            return self._filter_indexed(self._indexes[key].sections(), multiple, section_name)
+            
         if section_name:
-            sections = list(self._sections[section_name.lower()])
+            sections = self.get_all(section_name)
         else:
-            sections = self.to_list()
+            sections = self._sections.values()
             
         ret_list = []
         for section in sections:
@@ -104,29 +247,39 @@ class INIFile(object):
             return None
                     
     def get_by_kv(self, key, value, multiple=True, section_name=None, case_sensitive=False):
+        if key in self._indexes:
+            sections = self._indexes[key].find(value)
+            if case_sensitive:
+                sections = [section for section in sections if value in section.get_all(key)]
+            return self._filter_indexed(sections, multiple, section_name)
+            
         if section_name:
-            sections = list(self._sections[section_name.lower()])
+            sections = self.get_all(section_name)
         else:
-            sections = self.to_list()
+            sections = self._sections.values()
             
         if not case_sensitive:
             value = value.lower()
             
         ret_list = []
         for section in sections:
-            sec_value = section.get(key)
-            
-            if not sec_value:
+            for sec_value in section._options.get_values(key):
+                if not sec_value:
+                    continue
+                    
+                sec_value = str(sec_value)
+                if not case_sensitive:
+                    sec_value = sec_value.lower()
+                    
+                if sec_value == value:
+                    break
+            else:
                 continue
-            
-            if not case_sensitive:
-                sec_value = sec_value.lower()
-                            
-            if sec_value == value:
-                if multiple:
-                    ret_list.append(section)
-                else:
-                    return section            
+                
+            if multiple:
+                ret_list.append(section)
+            else:
+                return section
         
         if multiple:
             return ret_list
@@ -134,22 +287,38 @@ class INIFile(object):
             return None
         
     def set(self, section):
-        self._sections.set(section.name.lower(), section)
+        name = section.name.lower()
+        for old_section in self._sections.get_all(name):
+            self._unindex_section(old_section)
+            
+        self._sections.set(name, section)
+        self._order = None
+        self._index_section(section)
         
     def add(self, section):
-        self._sections[section.name.lower()] = section
+        self._sections.add(section.name.lower(), section)
+        
+        if self._order is not None:
+            # appended after the last section, which always has the highest position
+            last = next(reversed(self._order), None)
+            self._order[section] = self._order[last] + 1 if last is not None else 0
+            
+        self._index_section(section)
         
     def rem(self, section):
         if isinstance(section, IniSection):
             # remove by instance
-            current = self._sections[section.name.lower()]
-            if isinstance(current, list):
-                current.remove(section)
-            else:
-                del self._sections[section.name.lower()]
+            self._sections.remove(section.name.lower(), section)
+            removed = [section]
         else:
             # remove by name
+            removed = self._sections.get_all(section.lower())
             del self._sections[section.lower()]
+            
+        for old_section in removed:
+            self._unindex_section(old_section)
+            if self._order is not None:
+                del self._order[old_section]
     
     def rem_by_kv(self, key, value, case_sensitive=False):
         section = self.get_by_kv(key, value, multiple=False, case_sensitive=case_sensitive)
@@ -157,70 +326,134 @@ class INIFile(object):
         if section:
             self.rem(section)
     
-    def save(self):
-        raw = ''
-        for section in self.to_list():
-            raw += section.to_raw()
-
-        with codecs.open(self._filename, 'w', 'cp1252') as file:
-            file.write(raw)
-            
-    def to_list(self):
-        ret_list = []
+    def save(self, binary=False, keep_types=True):
+        # binary writes a BINI file. with keep_types, values that were read from a BINI and not
+        # changed since keep their original int/float/string types, all others are typed from
+        # their text. the file is written next to the ini and renamed over it, so a failed save
+        # leaves the old file in place.
+        temp_file = self._filename + '.tmp'
         
-        for key in self._sections:
-            value = self._sections[key]
-            if isinstance(value, list):
-                for section in value:
-                    ret_list.append(section)
+        try:
+            if binary:
+                writer = BINIWriter([section._to_bini(keep_types) for section in self._sections.values()])
+                writer.save(temp_file)
             else:
-                ret_list.append(value)
+                with open(temp_file, 'w', encoding='cp1252', newline='', buffering=_WRITE_BUFFER_SIZE) as file:
+                    for section in self._sections.values():
+                        file.write(section.to_raw())
+                        
+            os.replace(temp_file, self._filename)
+        except:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
             
-        return ret_list
+    def to_list(self):
+        return list(self._sections.values())
 
         
 class IniSection(object):
-    @staticmethod
-    def _strip_comments(string):
-        return string.split(';')[0].strip()
-        
-    def __init__(self, section_name):
+    __slots__ = ('name', '_option_map', '_loader', '_ini')
+    
+    def __init__(self, section_name, loader=None):
         self.name = section_name
-        self._options = MultiDict()
+        self._option_map = _CompactOptions()
+        self._loader = loader   # fills the options on first access, see INIFile(lazy=True)
+        self._ini = None        # the INIFile keeping indexes on this section, see INIFile.add_index
+        
+    @property
+    def _options(self):
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            loader(self)
+        return self._option_map
+        
+    def _add_bini(self, key, value, typed_values):
+        self._options.add(key, value, typed_values)
+        if self._ini is not None:
+            self._ini._update_indexes(self, key)
         
-    def _add_raw(self, line):
-        if not line.startswith(';'):
-            split = line.split('=')
-            
-            if len(split) == 1:
-                split.append('')
-                
-            if split[0] != '':
-                self._options[split[0].strip()] = self._strip_comments(split[1])
-    
     def get(self, key):
-        if key in self._options:
-            return self._options[key]
-        return None
+        # the value, or a list if key is repeated
+        options = self._option_map if self._loader is None else self._options
+        return options.get(key)
+        
+    def get_first(self, key, default=None):
+        return self._options.get_first(key, default)
+        
+    def get_all(self, key):
+        return self._options.get_all(key)
+        
+    def get_typed(self, key, multiple=False):
+        # the values of key as a tuple of ints, floats and strings (a list of tuples for every
+        # occurrence with multiple). BINI values keep their original types, text is typed once and
+        # cached until it changes.
+        positions = self._options.positions(key)
+        
+        if not positions:
+            return [] if multiple else None
+            
+        if not multiple:
+            positions = positions[:1]
+            
+        typed = [
+            tuple(value.value for value in self._get_typed_values(position))
+            for position in positions
+        ]
+        return typed if multiple else typed[0]
+        
+    def _get_typed_values(self, position):
+        options = self._options
+        values = options.typed_at(position)
+        
+        if values is None:
+            values = BINIWriter.values_from_string(str(options.value_at(position)).strip())
+            options.set_typed_at(position, values)
+        return values
         
     def set(self, key, value):
-        self._options.set(key, value)
+        # a list sets one option per value
+        if isinstance(value, list):
+            self._options.replace(key, value)
+        else:
+            self._options.set(key, value)
+            
+        if self._ini is not None:
+            self._ini._update_indexes(self, key)
     
     def add(self, key, value):
-        self._options[key] = value
+        self._options.add(key, value)
+        if self._ini is not None:
+            self._ini._update_indexes(self, key)
         
     def to_raw(self):
-        raw = '[{}]\r\n'.format(self.name)
+        lines = ['[{}]\r\n'.format(self.name)]
+        kv_to_raw = self._kv_to_raw
+        
+        for key, value in self._options.items():
+            lines.append(kv_to_raw(key, value))
+            
+        lines.append('\r\n')
+        return ''.join(lines)
+        
+    def _to_bini(self, keep_types=True):
+        entries = []
         
-        for key in self._options:
-            value = self._options[key]
-            if isinstance(value, list):
-                for val in value:
-                    raw += self._kv_to_raw(key, val)
+        for position, (key, value) in enumerate(self._options.items()):
+            if keep_types:
+                typed_values = self._get_typed_values(position)
             else:
-                raw += self._kv_to_raw(key, value)
+                typed_values = BINIWriter.values_from_string(str(value).strip())
                 
-        return raw + '\r\n'
+            entries.append({
+                'name': key,
+                'values': typed_values,
+            })
+                
+        return {
+            'name': self.name,
+            'entries': entries,
+        }
         
     def _kv_to_raw(self, key, value, allow_empty=True):
         if value == '' and not allow_empty:
@@ -236,5 +469,94 @@ class IniSection(object):
         
     def print_raw(self):
         print(self.to_raw())
+
+
+class _CompactOptions(OrderedMultiDict):
+    # the options of an IniSection with interned keys, plus the typed BINI values of each position
+    # once there are any, see IniSection.get_typed
+    __slots__ = ('_typed',)
+    
+    def __init__(self):
+        OrderedMultiDict.__init__(self)
+        self._typed = None
+        
+    def add(self, key, value, typed=None):
+        OrderedMultiDict.add(self, sys.intern(key), value)
+        
+        if typed is not None and self._typed is None:
+            self._typed = [None] * (len(self._values) - 1)
+        if self._typed is not None:
+            self._typed.append(typed)
+            
+    def extend(self, items):
+        # the text parser adds whole sections at once
+        if self._index is not None or self._typed is not None:
+            OrderedMultiDict.extend(self, items)
+            return
+            
+        keys = self._keys
+        values = self._values
+        intern = sys.intern
+        
+        for key, value in items:
+            keys.append(intern(key))
+            values.append(value)
             
-    
\ No newline at end of file
+    def value_at(self, position):
+        return self._values[position]
+        
+    def typed_at(self, position):
+        if self._typed is None:
+            return None
+        return self._typed[position]
+        
+    def set_typed_at(self, position, typed):
+        if self._typed is None:
+            self._typed = [None] * len(self._values)
+        self._typed[position] = typed
+        
+    def _assign(self, position, value):
+        OrderedMultiDict._assign(self, position, value)
+        if self._typed is not None:
+            self._typed[position] = None
+            
+    def _compact_lists(self, live):
+        OrderedMultiDict._compact_lists(self, live)
+        if self._typed is not None:
+            self._typed = list(compress(self._typed, live))
+
+
+class _SectionIndex(object):
+    # the sections having a key, by the lowercased text of each of their values. empty values are
+    # not indexed, get_by_kv never matched them.
+    def __init__(self, key):
+        self.key = key
+        self._by_value = {}
+        self._sections = {}  # section -> its indexed values, in the order the sections were indexed
+        
+    def add(self, section):
+        self.remove(section)
+        
+        if not section._has_key(self.key):
+            return
+            
+        indexed = []
+        for value in section.get_all(self.key):
+            value = str(value).lower()
+            if value and value not in indexed:
+                indexed.append(value)
+                self._by_value.setdefault(value, {})[section] = None
+        self._sections[section] = indexed
+        
+    def remove(self, section):
+        for value in self._sections.pop(section, ()):
+            sections = self._by_value[value]
+            del sections[section]
+            if not sections:
+                del self._by_value[value]
+                
+    def find(self, value):
+        return list(self._by_value.get(str(value).lower(), ()))
+        
+    def sections(self):
+        return list(self._sections)
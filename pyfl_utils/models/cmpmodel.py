@@ -203,9 +203,8 @@ class CMPModel(object):
         return out
 
     def _parse_components(self):
-        mesh_data = self.utf.find_nodes_with_name_in_path('\\VMeshLibrary')        
-        for mesh in mesh_data:
-            data = mesh.get_node_data('VMeshData')['data']
+        for mesh in self.utf.query('\\VMeshLibrary\\*'):
+            data = mesh.get_child('VMeshData')['data']
             new_node = VMeshData(data, mesh['name'])
 
             _logger.debug(f'found VMeshLibrary {new_node.mesh_name} ({new_node.crc})')
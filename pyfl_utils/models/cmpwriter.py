@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import struct
 
@@ -27,12 +26,14 @@ class CMPWriter(object):
         self.num_components = 0
 
     @staticmethod
-    async def _async_add_node(utf, lib):
+    def _lib_node(lib):
         _logger.info(f'save lib => {lib.mesh_name} ({lib.crc})')
         timer = Timer(_logger.debug)
-        utf.add_node(f'\\VMeshLibrary\\{lib.mesh_name}\\VMeshData', data=lib.to_raw_data())
+        data = lib.to_raw_data()
         timer.step('save lib done')
 
+        return f'\\VMeshLibrary\\{lib.mesh_name}\\VMeshData', data
+
     def add_part(self, file_name, index, object_name, mesh_ref):
         self.parts.append(Part(file_name, index, object_name, mesh_ref))
         self.num_components += 1
@@ -43,30 +44,27 @@ class CMPWriter(object):
     def save(self):
         utf = UTFFile()
 
-        tasks = []
-        for lib in self.libs:
-            _logger.debug('add task')
-            tasks.append(asyncio.ensure_future(self._async_add_node(utf, lib)))
-
-        _logger.debug('start tasks')
-        asyncio.get_event_loop().run_until_complete(asyncio.gather(*tasks))
+        utf.add_nodes(self._lib_node(lib) for lib in self.libs)
 
         timer = Timer(_logger.debug)
         self.components.write_component_data(utf)
         timer.step('save libs done')
 
         timer = Timer(_logger.debug)
+        nodes = []
         for part in self.parts:
             _logger.debug(f'save part {part.object_name} (using lib {part.mesh_ref.lib_id})')
 
-            utf.add_node(f'\\Cmpnd\\{part.object_name}\\File name', data=part.file_name.encode('UTF-8') + b'\x00')
-            utf.add_node(f'\\Cmpnd\\{part.object_name}\\Object name', data=part.object_name.encode('UTF-8') + b'\x00')
-            utf.add_node(f'\\Cmpnd\\{part.object_name}\\Index', data=struct.pack('ii', part.index, 0))
+            nodes.append((f'\\Cmpnd\\{part.object_name}\\File name', part.file_name.encode('UTF-8') + b'\x00'))
+            nodes.append((f'\\Cmpnd\\{part.object_name}\\Object name', part.object_name.encode('UTF-8') + b'\x00'))
+            nodes.append((f'\\Cmpnd\\{part.object_name}\\Index', struct.pack('ii', part.index, 0)))
 
             ref_name = f'\\{part.file_name}\\MultiLevel\\Level0\\VMeshPart\\VMeshRef'
 
-            utf.add_node(ref_name, data=part.mesh_ref.to_raw_data())
-            timer.step('save part done')
+            nodes.append((ref_name, part.mesh_ref.to_raw_data()))
+
+        utf.add_nodes(nodes)
+        timer.step('save parts done')
 
         for hardpoint in self.hardpoints:
             hardpoint.save(utf)
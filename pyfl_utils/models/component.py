@@ -56,17 +56,21 @@ class Component(object):
         self.has_data = True
 
     def write_component_data(self, utf_file):
+        nodes = []
+
         if self.fix_data:
-            utf_file.add_node('\\Cmpnd\\Cons\\Fix', data=self._fix_to_raw())
+            nodes.append(('\\Cmpnd\\Cons\\Fix', self._fix_to_raw()))
 
         if self.rev_data:
-            utf_file.add_node('\\Cmpnd\\Cons\\Rev', data=self._revolute_to_raw())
+            nodes.append(('\\Cmpnd\\Cons\\Rev', self._revolute_to_raw()))
 
         if self.pris_data:
-            utf_file.add_node('\\Cmpnd\\Cons\\Pris', data=self._pris_to_raw())
+            nodes.append(('\\Cmpnd\\Cons\\Pris', self._pris_to_raw()))
 
         if self.sph_data:
-            utf_file.add_node('\\Cmpnd\\Cons\\Sphere', data=self._sphere_to_raw())
+            nodes.append(('\\Cmpnd\\Cons\\Sphere', self._sphere_to_raw()))
+
+        utf_file.add_nodes(nodes)
 
     def get_offset(self, db_name):
         offsets = {'x': 0, 'y': 0, 'z': 0}
@@ -109,7 +113,7 @@ class Component(object):
         return self.rotations_by_part_name[part_name]      
     
     def _parse_comp_data_nodes(self, cmp):
-        self.comp_data = cmp.find_nodes_with_name_in_path('\\Cmpnd')
+        self.comp_data = list(cmp.query('\\Cmpnd\\*'))
                 
         self._component_data = {}
         for node in self.comp_data:
@@ -118,8 +122,8 @@ class Component(object):
     def _build_offsets(self):
         for part in self._component_data:
             if part not in ['Cons']:
-                object_name = self._component_data[part].get_node_data('Object name')
-                file_name = self._component_data[part].get_node_data('File name')
+                object_name = self._component_data[part].get_child('Object name')
+                file_name = self._component_data[part].get_child('File name')
                                 
                 # remove zero-terminator
                 object_name = self._unpack_name(object_name['data'])
@@ -198,7 +202,7 @@ class Component(object):
         return node
         
     def _parse_fix(self):
-        node = self._component_data['Cons'].get_node_data('Fix')
+        node = self._component_data['Cons'].get_child('Fix')
         
         if not node:
             return
@@ -226,7 +230,7 @@ class Component(object):
         return writer.raw_data
 
     def _parse_revolute(self):
-        node = self._component_data['Cons'].get_node_data('Rev')
+        node = self._component_data['Cons'].get_child('Rev')
         
         if not node:
             return
@@ -262,7 +266,7 @@ class Component(object):
         return writer.raw_data
         
     def _parse_sphere(self):
-        node = self._component_data['Cons'].get_node_data('Sphere')
+        node = self._component_data['Cons'].get_child('Sphere')
         
         if not node:
             return
@@ -306,7 +310,7 @@ class Component(object):
         return writer.raw_data
 
     def _parse_pris(self):
-        node = self._component_data['Cons'].get_node_data('Pris')
+        node = self._component_data['Cons'].get_child('Pris')
         
         if not node:
             return
@@ -25,18 +25,21 @@ class Hardpoint(object):
 
     def save(self, utf):
         base_name = f'\\{self.file_name}\\Hardpoints\\{self.type}\\{self.name}'
+        nodes = []
 
         if self.orientation:
-            utf.add_node(f'{base_name}\\Orientation', data=struct.pack('f' * 9, *self.orientation))
+            nodes.append((f'{base_name}\\Orientation', struct.pack('f' * 9, *self.orientation)))
 
         if self.position:
-            utf.add_node(f'{base_name}\\Position', data=struct.pack('f' * 3, *self.position))
+            nodes.append((f'{base_name}\\Position', struct.pack('f' * 3, *self.position)))
 
         if self.axis:
-            utf.add_node(f'{base_name}\\Axis', data=struct.pack('f' * 3, *self.axis))
+            nodes.append((f'{base_name}\\Axis', struct.pack('f' * 3, *self.axis)))
 
         if self.min:
-            utf.add_node(f'{base_name}\\Min', data=struct.pack('f' * 3, *[self.min, 0]))
+            nodes.append((f'{base_name}\\Min', struct.pack('f' * 3, *[self.min, 0])))
 
         if self.max:
-            utf.add_node(f'{base_name}\\Max', data=struct.pack('f' * 3, *[self.max, 0]))
+            nodes.append((f'{base_name}\\Max', struct.pack('f' * 3, *[self.max, 0])))
+
+        utf.add_nodes(nodes)
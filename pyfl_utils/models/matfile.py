@@ -64,32 +64,35 @@ class MatLibEntry(object):
 
     def add_to_utf(self, utf: UTFFile):
         base_path = f'\\material library\\{self.name}'
+        nodes = []
 
         if self.dc and self._is_valid_float_array(self.dc, 4):
             _logger.debug(f'adding {self.name} diffuse color (Dc)')
-            utf.add_node(f'{base_path}\\Dc', data=struct.pack('ffff', *self.dc))
+            nodes.append((f'{base_path}\\Dc', struct.pack('ffff', *self.dc)))
 
         if self.oc and self._is_valid_float_array(self.oc, 2):
             _logger.debug(f'adding {self.name} opacity (Oc)')
-            utf.add_node(f'{base_path}\\Oc', data=struct.pack('ff', *self.oc))
+            nodes.append((f'{base_path}\\Oc', struct.pack('ff', *self.oc)))
 
         if self.dt_name:
             _logger.debug(f'adding {self.name} diffuse texture (Dt_name / Dt_flags)')
-            utf.add_node(f'{base_path}\\Dt_name', data=self.dt_name.encode('UTF-8') + b'\x00')
-            utf.add_node(f'{base_path}\\Dt_flags', data=self.dt_flags)
+            nodes.append((f'{base_path}\\Dt_name', self.dt_name.encode('UTF-8') + b'\x00'))
+            nodes.append((f'{base_path}\\Dt_flags', self.dt_flags))
 
         if self.et_name:
             _logger.debug(f'adding {self.name} emissive texture (Et_name / Et_flags)')
-            utf.add_node(f'{base_path}\\Et_name', data=self.et_name.encode('UTF-8') + b'\x00')
-            utf.add_node(f'{base_path}\\Et_flags', data=self.et_flags)
+            nodes.append((f'{base_path}\\Et_name', self.et_name.encode('UTF-8') + b'\x00'))
+            nodes.append((f'{base_path}\\Et_flags', self.et_flags))
 
         if self.bt_name:
             _logger.debug(f'adding {self.name} bump texture (Bt_name / Bt_flags)')
-            utf.add_node(f'{base_path}\\Bt_name', data=self.bt_name.encode('UTF-8') + b'\x00')
-            utf.add_node(f'{base_path}\\Bt_flags', data=self.bt_flags)
+            nodes.append((f'{base_path}\\Bt_name', self.bt_name.encode('UTF-8') + b'\x00'))
+            nodes.append((f'{base_path}\\Bt_flags', self.bt_flags))
 
         _logger.debug(f'adding {self.name} Type as {self.type}')
-        utf.add_node(f'{base_path}\\Type', data=self.type)
+        nodes.append((f'{base_path}\\Type', self.type))
+
+        utf.add_nodes(nodes)
 
 
 class TexLibEntry(object):
@@ -35,7 +35,7 @@ class TexturePack(object):
 
     def _load_images(self):
         for txm in self.txms:
-            mat_lib = txm.find_nodes_with_name_in_path('\\material library')
+            mat_lib = txm.query('\\material library\\*')
 
             matches = self._search_for_items(mat_lib)
 
@@ -112,12 +112,12 @@ class TexturePack(object):
         for mat_node in mat_lib:
             mat_crc = crc(mat_node['name'])
             if mat_crc in self.material_ids:
-                base_texture = mat_node.get_node_data('Dt_name')
-                emissive_texture = mat_node.get_node_data('Et_name')
-                bump_texture = mat_node.get_node_data('Bt_name')
+                base_texture = mat_node.get_child('Dt_name')
+                emissive_texture = mat_node.get_child('Et_name')
+                bump_texture = mat_node.get_child('Bt_name')
 
-                diffuse_color = mat_node.get_node_data('Dc')
-                opacity = mat_node.get_node_data('Oc')
+                diffuse_color = mat_node.get_child('Dc')
+                opacity = mat_node.get_child('Oc')
 
                 matches.append({
                     'crc': mat_crc,
@@ -1,4 +1,7 @@
 from collections import OrderedDict
+from bisect import bisect_left
+from itertools import compress
+from operator import indexOf
 
 
 class MultiDict(OrderedDict):
@@ -13,3 +16,221 @@ class MultiDict(OrderedDict):
 			
 	def set(self, key, val):
 		OrderedDict.__setitem__(self, key, val)
+
+
+# takes the key's place in the slot of a removed value until the lists are compacted
+_REMOVED = object()
+
+
+class OrderedMultiDict(object):
+	# keys with any number of values, in the order they were added. adding a value and reading the
+	# values of a key are O(1), values() and items() walk all of them in insertion order without
+	# building a list. the index of a key is the position of its value, or the list of positions when
+	# it has several. it is built on the first lookup, so maps that are only iterated stay two lists.
+	# removing a value only marks its slot, see _drop.
+	__slots__ = ('_keys', '_values', '_index', '_removed')
+	
+	def __init__(self, items=None):
+		self._keys = []
+		self._values = []
+		self._index = None  # key -> position or positions of its values, see _get_index
+		self._removed = 0   # marked slots
+		
+		if items is not None:
+			self.extend(items)
+			
+	def __contains__(self, key):
+		return key in self._get_index()
+		
+	def __len__(self):
+		return len(self._values) - self._removed
+		
+	def __iter__(self):
+		return self.keys()
+		
+	def __delitem__(self, key):
+		positions = self.positions(key)
+		if not positions:
+			raise KeyError(key)
+		self._drop(key, positions)
+		
+	def add(self, key, value):
+		index = self._index
+		if index is not None:
+			position = len(self._keys)
+			indexed = index.get(key)
+			
+			if indexed is None:
+				index[key] = position
+			elif isinstance(indexed, int):
+				index[key] = [indexed, position]
+			else:
+				indexed.append(position)
+				
+		self._keys.append(key)
+		self._values.append(value)
+		
+	def extend(self, items):
+		for key, value in items:
+			self.add(key, value)
+			
+	def set(self, key, value):
+		self.replace(key, [value])
+		
+	def replace(self, key, values):
+		# the new values take the positions of the old ones, surplus values are appended
+		positions = self.positions(key)
+		
+		for position, value in zip(positions, values):
+			self._assign(position, value)
+			
+		self._drop(key, positions[len(values):])
+		
+		for value in values[len(positions):]:
+			self.add(key, value)
+			
+	def remove(self, key, value):
+		# removes the first value of key that equals value
+		positions = self._get_index().get(key, ())
+		if positions.__class__ is int:
+			positions = (positions,)
+			
+		try:
+			found = indexOf(map(self._values.__getitem__, positions), value)
+		except ValueError:
+			raise KeyError(key)
+			
+		self._drop(key, [positions[found]])
+		
+	def get(self, key, default=None):
+		# the value, or a list of the values if key is repeated
+		index = self._index
+		if index is None:
+			index = self._get_index()
+			
+		indexed = index.get(key)
+		
+		if indexed.__class__ is int:
+			return self._values[indexed]
+		if indexed is None:
+			return default
+		values = self._values
+		return [values[position] for position in indexed]
+		
+	def get_first(self, key, default=None):
+		index = self._index
+		if index is None:
+			index = self._get_index()
+			
+		indexed = index.get(key)
+		
+		if indexed is None:
+			return default
+		if isinstance(indexed, int):
+			return self._values[indexed]
+		return self._values[indexed[0]]
+		
+	def get_values(self, key):
+		# like get_all, but a single value comes back as a tuple without collecting its position
+		# first
+		index = self._index
+		if index is None:
+			index = self._get_index()
+			
+		indexed = index.get(key)
+		
+		if indexed is None:
+			return ()
+		if isinstance(indexed, int):
+			return (self._values[indexed],)
+		values = self._values
+		return [values[position] for position in indexed]
+		
+	def get_all(self, key):
+		values = self._values
+		return [values[position] for position in self.positions(key)]
+		
+	def positions(self, key):
+		indexed = self._get_index().get(key)
+		
+		if indexed is None:
+			return []
+		if isinstance(indexed, int):
+			return [indexed]
+		return list(indexed)
+		
+	def keys(self):
+		# every key once, in the order of its first value
+		if self._removed:
+			self._compact()
+		return iter(dict.fromkeys(self._keys))
+		
+	def values(self):
+		if self._removed:
+			self._compact()
+		return iter(self._values)
+		
+	def items(self):
+		if self._removed:
+			self._compact()
+		return zip(self._keys, self._values)
+		
+	def _get_index(self):
+		if self._index is None:
+			index = {}
+			for position, key in enumerate(self._keys):
+				indexed = index.get(key)
+				
+				if indexed is None:
+					index[key] = position
+				elif isinstance(indexed, int):
+					index[key] = [indexed, position]
+				else:
+					indexed.append(position)
+			self._index = index
+			
+		return self._index
+		
+	def _assign(self, position, value):
+		self._values[position] = value
+		
+	def _drop(self, key, positions):
+		# positions are some or all positions of key. the slots are marked and taken out of the index,
+		# the lists are only compacted when the map is iterated or half of the slots are marked.
+		if not positions:
+			return
+			
+		index = self._get_index()
+		indexed = index[key]
+		
+		if indexed.__class__ is int or len(indexed) == len(positions):
+			del index[key]
+		else:
+			if len(positions) == 1:
+				del indexed[bisect_left(indexed, positions[0])]
+			else:
+				dropped = set(positions)
+				indexed[:] = [position for position in indexed if position not in dropped]
+				
+			if len(indexed) == 1:
+				index[key] = indexed[0]
+				
+		keys = self._keys
+		values = self._values
+		for position in positions:
+			keys[position] = _REMOVED
+			values[position] = None
+			
+		self._removed += len(positions)
+		if self._removed * 2 > len(keys):
+			self._compact()
+			
+	def _compact(self):
+		live = [key is not _REMOVED for key in self._keys]
+		self._compact_lists(live)
+		self._removed = 0
+		self._index = None
+		
+	def _compact_lists(self, live):
+		self._keys = list(compress(self._keys, live))
+		self._values = list(compress(self._values, live))
@@ -1,5 +1,6 @@
 import logging
 import os
+from io import BytesIO
 from .fldll import FLDll
 from .utf import UTFFile
 from .inifile import INIFile, IniSection
@@ -14,6 +15,7 @@ class Newsvendor(object):
 	
 	def __init__(self, settings=settings):
 		self._news_ini = INIFile(settings.news)
+		self._news_ini.add_index('newsid')
 		self._dll = FLDll(settings.dll, settings.fl)
 		self._tex = UTFFile(settings.tex)
 
@@ -41,7 +43,7 @@ class Newsvendor(object):
 		
 		self._news_ini.save()
 		self._dll.save()
-		self._tex.save()
+		self._tex.save(in_place=True)
 					
 		return {'status': 'OK', 'newsid': newsid}
 		
@@ -62,7 +64,7 @@ class Newsvendor(object):
 			
 			self._news_ini.save()
 			self._dll.save()
-			self._tex.save()
+			self._tex.save(in_place=True)
 			
 			return True
 			
@@ -176,17 +178,19 @@ class Newsvendor(object):
 			for name in files:
 				os.remove(os.path.join(root, name))		
 				
-		self._tex.save_data_to_file('MIP0', '.tga', basepath)
+		# converted in the extraction pool, no intermediate tga files
+		self._tex.extract('MIP0', basepath, '.tga', transform=self._tga_to_png)
 		
-		for root, dirs, files in os.walk(basepath):
-			for in_name in files:
-				in_name = os.path.join(root, in_name)
-				out_name = in_name.replace('_Texture library_', '')
-				out_name = out_name.replace('_MIP0.tga', '.png')
-				
-				im = Image.open(in_name)
-				im.save(out_name)		
-				os.remove(in_name)
+	@staticmethod
+	def _tga_to_png(out_name, data):
+		out_name = out_name.replace('_Texture library_', '')
+		out_name = out_name.replace('_MIP0.tga', '.png')
+		
+		buffer = BytesIO()
+		with Image.open(BytesIO(data)) as im:
+			im.save(buffer, 'PNG')
+			
+		return out_name, buffer.getbuffer()
 				
 	def export_image(self, image_name):
 		basepath = './html/img/newsimages/'
@@ -254,9 +258,7 @@ class Newsvendor(object):
 	def _update_bases(self, ini_section):
 		universe = INIFile(settings.universe)
 		
-		base_sections = universe.get('base')
-		
 		bases = []
-		for section in base_sections:
-			bases.append(section.get('nickname'))
+		for section in universe.get_all('base'):
+			bases.append(section.get_first('nickname'))
 		ini_section.set('base', bases)
@@ -1,110 +1,724 @@
 import os
+import re
+import sys
+import mmap
+import fnmatch
+import bisect
+import hashlib
 import struct
 import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 _logger = logging.getLogger(__name__)
 
+_header_fields = (
+    'signature',
+    'version',
+    
+    # node chunk
+    'node_block_offset',
+    'node_size',
+    
+    'unknown',              # unknown, ask schmacki
+    
+    # header
+    'header_size',
+    
+    # string block
+    'string_block_offset',
+    'string_block_alloc',   # unknown, ask schmacki
+    'string_block_size',
+    
+    # data block
+    'data_block_offset',
+    
+    # unknown, ask schmacki
+    'unknown2',
+    
+    # whatever date information might be in there...
+    'timestamp_0',
+    'timestamp_1',
+    'timestamp_2',
+)
+_header_struct = struct.Struct('14I')
+
+_node_fields = (
+    'peer_offset',          # next (sibling) node
+    'name_offset',
+    'flags',
+    '_null_',               # unknown, ask schmacki
+    'data_block_offset',    # OR child node offset
+    'allocated_size',       # leaf only
+    'size',                 # leaf only
+    'size2',                # leaf only
+    
+    # more unknowns
+    'timestamp_0',
+    'timestamp_1',
+    'timestamp_2',
+)
+_node_struct = struct.Struct('11I')
+
+UTFScanEntry = namedtuple('UTFScanEntry', ['path', 'name', 'node_type', 'size', 'allocated_size', 'offset'])
+
+_ANY_DEPTH = '**'
+
+
+def _join_path(parent_path, name):
+    if parent_path != '' and parent_path != '\\':
+        return parent_path + '\\' + name
+    return parent_path + name
+
+
+def _decode_string_block(string_block):
+    # offset -> name for every terminated string in the block. names repeat a lot, so they are
+    # interned.
+    names = {}
+    offset = 0
+    
+    for name in bytes(string_block).split(b'\x00')[:-1]:
+        names[offset] = sys.intern(name.decode('latin-1'))
+        offset += len(name) + 1
+        
+    return names
+
+
+def _is_intermediate(flags, data_block_offset):
+    return flags == 16 and data_block_offset > 0
+
+
+def _read_node_record(node_table, raw, node_block_offset, offset):
+    # offset is relative to the node block, records that do not line up with the table are read directly
+    index, misaligned = divmod(offset, _node_struct.size)
+    
+    if not misaligned and 0 <= index < len(node_table):
+        return node_table[index]
+    return _node_struct.unpack_from(raw, node_block_offset + offset)
+
+
+def _walk_node_links(get_record, root, create_node):
+    # walks the sibling (peer) and child links without recursion. the child entry is
+    # pushed last, so a node's subtree is completed before its next sibling is created,
+    # which keeps the children in on-disk order.
+    stack = [(root, 0)]
+    visited = set()
+    first_node = None
+    
+    while stack:
+        parent, offset = stack.pop()
+        
+        if offset in visited:
+            _logger.warning('node at offset {} is linked more than once, skipping'.format(offset))
+            continue
+        visited.add(offset)
+        
+        record = get_record(offset)
+        node = create_node(parent, offset, record)
+        if first_node is None:
+            first_node = node
+            
+        peer_offset, _, flags, _, data_block_offset = record[:5]
+        
+        if peer_offset > 0:
+            stack.append((parent, peer_offset))
+            
+        if _is_intermediate(flags, data_block_offset):
+            stack.append((node, data_block_offset))
+            
+    return first_node
+
+
+@lru_cache(maxsize=256)
+def _compile_query(pattern, case_sensitive=True):
+    # one entry per path level: _ANY_DEPTH, a plain name (looked up in the child name map)
+    # or the match function of a glob. patterns without a leading backslash match at any depth.
+    parts = pattern.split('\\')
+    
+    if parts[0]:
+        parts.insert(0, _ANY_DEPTH)
+        
+    segments = []
+    for part in parts:
+        if not part or (part == _ANY_DEPTH and segments and segments[-1] is _ANY_DEPTH):
+            continue
+        
+        if part == _ANY_DEPTH:
+            segments.append(_ANY_DEPTH)
+        elif any(char in part for char in '*?['):
+            flags = 0 if case_sensitive else re.IGNORECASE
+            segments.append(re.compile(fnmatch.translate(part), flags).match)
+        else:
+            segments.append(part)
+            
+    return tuple(segments)
+    
+    
+def _walk_query(node, segments):
+    # only branches that still match the pattern are entered. _ANY_DEPTH can reach a node in
+    # more than one way, so the states are tracked to yield every node once.
+    stack = [(node, 0)]
+    seen = set() if _ANY_DEPTH in segments else None
+    
+    while stack:
+        node, index = stack.pop()
+        
+        if seen is not None:
+            if (node, index) in seen:
+                continue
+            seen.add((node, index))
+        
+        if index == len(segments):
+            if seen is None or (node, None) not in seen:
+                if seen is not None:
+                    seen.add((node, None))
+                yield node
+            continue
+            
+        segment = segments[index]
+        
+        if segment is _ANY_DEPTH:
+            stack.extend((child, index) for child in reversed(node._children))
+            stack.append((node, index + 1))
+        elif isinstance(segment, str):
+            child_names = node._get_child_names()
+            if child_names:
+                children = child_names.get(node._name_key(segment), ())
+                stack.extend((child, index + 1) for child in reversed(children))
+        else:
+            stack.extend((child, index + 1) for child in reversed(node._children) if segment(child._name))
+
 
 class UTFFile(object):
-    def __init__(self, utf_file=None):
+    def __init__(self, utf_file=None, use_mmap=False, case_sensitive=True):
         self._file = os.path.abspath(utf_file) if utf_file else None
+        self._use_mmap = use_mmap
+        self._mmap = None
+        self._case_sensitive = case_sensitive
+        
+        # lookup structures, all built on the first lookup that needs them: node name -> nodes,
+        # the sorted reversed names (names ending with a string are one range there) and the
+        # position of every node in tree order
+        self._names = None
+        self._suffixes = None
+        self._order = None
+        
+        # file the node offsets currently describe, an in place save is only possible there
+        self._layout_file = None
+        self._structure_changed = False
         
         if utf_file and os.path.isfile(self._file):
             self._load_file()
+            self._layout_file = self._file
         else:
-            self._root = UTFTreeRoot()
+            self._root = UTFTreeRoot(case_sensitive=case_sensitive)
+            
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *args):
+        self.close()
+                
+    @staticmethod
+    def scan(utf_file):
+        # lists all nodes without loading any leaf data, only the header, node block and
+        # string block are read from the file
+        with open(utf_file, 'rb') as fi:
+            raw_header = fi.read(_header_struct.size)
+            
+            if len(raw_header) < _header_struct.size or raw_header[0:4] != b'UTF ':
+                raise Exception('not a valid utf file!')
+                
+            header = dict(zip(_header_fields, _header_struct.unpack(raw_header)))
+            
+            fi.seek(header['node_block_offset'])
+            node_block = fi.read(header['node_size'])
+            
+            fi.seek(header['string_block_offset'])
+            string_block = fi.read(header['string_block_size'])
+            
+        node_table = list(_node_struct.iter_unpack(node_block[:len(node_block) - len(node_block) % _node_struct.size]))
+        names = _decode_string_block(string_block)
+        entries = []
+        
+        def create_entry(parent_path, offset, record):
+            name_offset = record[1]
+            name = names.get(name_offset)
+            if name is None:
+                name_end = string_block.find(b'\x00', name_offset)
+                name = string_block[name_offset:name_end if name_end >= 0 else None].decode('latin-1')
+            path = _join_path(parent_path, name)
+            
+            if _is_intermediate(record[2], record[4]):
+                entries.append(UTFScanEntry(path, name, 'intermediate', 0, 0, None))
+            else:
+                entries.append(UTFScanEntry(path, name, 'leaf', record[6], record[5], header['data_block_offset'] + record[4]))
+            return path
+            
+        _walk_node_links(lambda offset: _read_node_record(node_table, node_block, 0, offset), '', create_entry)
+        return entries
                 
     def _load_raw(self):
-        fi = open(self._file, 'rb')
-        raw_data = fi.read()
-        fi.close()
+        with open(self._file, 'rb') as fi:
+            if self._use_mmap and os.path.getsize(self._file) > 0:
+                # leaf data will be zero-copy slices of the mapping, only paged in when read
+                self._mmap = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+                raw_data = memoryview(self._mmap)
+            else:
+                raw_data = fi.read()
                 
         if raw_data[0:4] != b'UTF ':
+            if self._mmap:
+                raw_data.release()
+                self._mmap.close()
+                self._mmap = None
             raise Exception('not a valid utf file!')
             
         return raw_data
         
     def _load_file(self):
         raw_data = self._load_raw()
-        self._root = UTFTreeRoot(raw_data)
+        self._root = UTFTreeRoot(raw_data, self._case_sensitive)
         
     def print_tree(self):
         self._root.print_tree()
         
+    def _key(self, string):
+        return string if self._case_sensitive else string.lower()
+        
+    def _get_names(self):
+        if self._names is None:
+            names = {}
+            for node in self._root._get_root_node()._iter_nodes():
+                nodes = names.get(self._key(node._name))
+                if nodes is None:
+                    names[self._key(node._name)] = [node]
+                else:
+                    nodes.append(node)
+            self._names = names
+        return self._names
+        
+    def _index_node(self, node):
+        if self._names is None:
+            return
+            
+        key = self._key(node._name)
+        nodes = self._names.get(key)
+        if nodes is None:
+            self._names[key] = [node]
+            self._suffixes = None
+        else:
+            nodes.append(node)
+            
+    def _unindex_nodes(self, nodes):
+        if self._names is None:
+            return
+            
+        removed = {}
+        for node in nodes:
+            removed.setdefault(self._key(node._name), set()).add(node)
+            
+        for key, removed_nodes in removed.items():
+            remaining = [node for node in self._names.get(key, ()) if node not in removed_nodes]
+            if remaining:
+                self._names[key] = remaining
+            else:
+                self._names.pop(key, None)
+                self._suffixes = None
+                
+    def _names_ending_with(self, suffix):
+        # every indexed name that ends with suffix, through a bisect on the reversed names
+        if self._suffixes is None:
+            self._suffixes = sorted(name[::-1] for name in self._get_names())
+            
+        suffixes = self._suffixes
+        reversed_suffix = suffix[::-1]
+        index = bisect.bisect_left(suffixes, reversed_suffix)
+        
+        while index < len(suffixes) and suffixes[index].startswith(reversed_suffix):
+            yield suffixes[index][::-1]
+            index += 1
+            
+    def _tree_order(self):
+        # only rebuilt after nodes were added, removing or renaming nodes keeps the relative order
+        if self._order is None:
+            self._order = {
+                node: position
+                for position, node in enumerate(self._root._get_root_node()._iter_nodes())
+            }
+        return self._order
+        
+    def _find_nodes(self, node_name):
+        # the nodes whose path ends with node_name, in tree order. like the recursive walk comparing
+        # node['path'].endswith() this stops at a match, nodes below a matching node are not
+        # returned. the names after the first '\\' of node_name have to match whole node names, so
+        # they are followed through the child maps from either the nodes carrying the first of them
+        # or the nodes whose name ends with the part before it, whichever are fewer. the part before
+        # the first '\\' only has to be the end of a name.
+        node_name = self._key(node_name)
+        root_node = self._root._get_root_node()
+        
+        if not node_name:
+            return [root_node]
+            
+        names = self._get_names()
+        anchor, *chain = node_name.split('\\')
+        
+        if not chain:
+            nodes = [node for name in self._names_ending_with(anchor) for node in names[name]]
+        else:
+            named = names.get(chain[0], ())
+            parents = None
+            
+            if anchor:
+                parents = []
+                for name in self._names_ending_with(anchor):
+                    parents.extend(names[name])
+                    if len(parents) >= len(named):
+                        parents = None
+                        break
+                        
+            if parents is not None:
+                nodes = self._follow_children(parents, chain)
+            else:
+                # the first name of the chain has to follow the end of its parent's name, children
+                # of the root node follow the leading '\\' of the path
+                nodes = [
+                    node for node in named
+                    if node is not root_node and (
+                        self._key(node._parent._name).endswith(anchor) if node._parent is not root_node 
+                        else not anchor
+                    )
+                ]
+                nodes = self._follow_children(nodes, chain[1:])
+                
+            if node_name == '\\':
+                nodes.append(root_node)
+                
+        if len(nodes) > 1:
+            nodes = self._outermost(nodes)
+            nodes.sort(key=self._tree_order().__getitem__)
+        return nodes
+        
+    @staticmethod
+    def _outermost(nodes):
+        # drops the nodes below another one of nodes
+        found = set(nodes)
+        outermost = []
+        
+        for node in nodes:
+            parent = node._parent
+            while parent is not None and parent not in found:
+                parent = parent._parent
+            if parent is None:
+                outermost.append(node)
+        return outermost
+        
+    @staticmethod
+    def _follow_children(nodes, chain):
+        for name in chain:
+            nodes = [
+                child 
+                for node in nodes if node._children 
+                for child in node._get_child_names().get(name, ())
+            ]
+        return nodes
+        
+    def _find_leaves(self, node_name):
+        leaves = []
+        for node in self._find_nodes(node_name):
+            if 'data' in node:
+                leaves.append(node)
+            else:
+                _logger.error('node does not contain data')
+        return leaves
+        
     def save_data_to_file(self, node_name, filename='', multiple=False):
-        found = self._root.save_data_to_file(node_name, filename, multiple)
+        if multiple:
+            self.extract(node_name, multiple, filename)
+            return
+            
+        found = self._find_leaves(node_name)[:1]
+            
+        for node in found:
+            with open(filename, 'wb') as fi:
+                fi.write(node['data'])
         
-        if not found and not multiple:
+        if not found:
             _logger.warning(f'node "{node_name}" not found')
             
+    def extract(self, node_name, basepath, suffix='', transform=None, max_workers=None):
+        # writes every leaf matching node_name to basepath + path with '\\' replaced by '_' + suffix,
+        # the same names as save_data_to_file in multiple mode. the leaves are collected first and
+        # written by a thread pool straight from their buffers. transform(out_name, data) runs in the
+        # pool and returns the (out_name, data) to write instead, e.g. to convert images.
+        # returns the written file names in tree order.
+        found = self._find_leaves(node_name)
+        
+        def write(node):
+            out_name = basepath + node['path'].replace('\\', '_') + suffix
+            data = node['data']
+            
+            if transform:
+                out_name, data = transform(out_name, data)
+                
+            with open(out_name, 'wb') as fi:
+                fi.write(data)
+            return out_name
+            
+        if len(found) < 2:
+            return [write(node) for node in found]
+            
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(write, found))
+            
     def get_node_data(self, node_name, multiple=False):
-        found = self._root.get_node_data(node_name, multiple)
+        found = self._find_leaves(node_name)
         
-        if not found and not multiple:
+        if multiple:
+            return found
+        
+        if not found:
             _logger.warning(f'node "{node_name}" not found')
         else:
-            return found
+            return found[0]
             
     def update_node_data(self, node_name, filename, create=False):
-        found = self._root.update_node_data(node_name, filename)
+        found = self._find_nodes(node_name)
         
-        if not found and create:
+        if found:
+            found[0]._set_data(filename)
+        elif create:
             self.add_node(node_name, filename)
             
     def rename_node(self, old_name, new_name):
         old_name_parts = old_name.split('\\')[1:]
         new_name_parts = new_name.split('\\')[1:]
         root_node = self._root._get_root_node()
+        renamed = []
+        
+        ret = self._rename_node(old_name_parts, new_name_parts, root_node, renamed)
         
-        return self._rename_node(old_name_parts, new_name_parts, root_node)
+        if renamed:
+            for child in renamed:
+                self._index_node(child)
+            self._structure_changed = True
+        return ret
         
-    def _rename_node(self, old_name_parts, new_name_parts, node):
+    def _rename_node(self, old_name_parts, new_name_parts, node, renamed):
         assert len(old_name_parts) == len(new_name_parts)
         
         current_search = old_name_parts[0]
         current_replace = new_name_parts[0]
                 
         ret = False
-        for child in node.get_children():
-            if child['name'] == current_search:
+        child = node.get_child(current_search)
+        if child is not None:
+            if current_search != current_replace:
+                self._unindex_nodes([child])
                 child['name'] = current_replace
-                
-                if len(old_name_parts) > 1:
-                    ret = self._rename_node(old_name_parts[1:], new_name_parts[1:], child)
-                else: ret = True
-                break
+                renamed.append(child)
+            
+            if len(old_name_parts) > 1:
+                ret = self._rename_node(old_name_parts[1:], new_name_parts[1:], child, renamed)
+            else: ret = True
         return ret
         
     def delete_node(self, node_name):
-        return self._root.delete_node(node_name)
+        found = self._find_nodes(node_name)
+        
+        if not found:
+            return False
+        
+        node = found[0]
+        _logger.debug('found node "{}".'.format(node_name))
+        
+        subtree = list(node._iter_nodes())
+        self._unindex_nodes(subtree)
+        if self._order is not None:
+            for child in subtree:
+                del self._order[child]
+                
+        node._parent.remove_child(node)
+        self._structure_changed = True
+        return True
+            
+    def close(self):
+        # only needed for use_mmap. leaves that were not edited still point into the
+        # mapping and can not be read anymore once it is closed.
+        if not self._mmap:
+            return
+            
+        if not self._close_mapping():
+            _logger.warning('leaf data is still referenced, the mapping stays open until released')
+            self._mmap = None
+            
+    def _close_mapping(self):
+        # False if views of the mapping are still held outside of the tree, e.g. slices of
+        # node data. the mapping can only be closed once those are released.
+        self._root._release_data()
+        
+        try:
+            self._mmap.close()
+        except BufferError:
+            return False
             
-    def save(self, filename=False):
+        self._mmap = None
+        return True
+            
+    def save(self, filename=False, in_place=False, dedupe=False):
+        # returns the number of bytes saved by dedupe
         if not filename:
             filename = self._file
 
-        self._root._write_to_file(filename)
+        if in_place:
+            if self._can_patch(filename):
+                self._patch_file(filename)
+                return 0
+            _logger.debug('changes do not fit the existing layout, rewriting "{}"'.format(filename))
 
-    def add_node(self, node_path, file_path=None, data=None):
-        path_parts = node_path.split('\\')[1:]
-        root_node = self._root._get_root_node()
-        first_parent, remaining_path = self._find_node_matching_path(path_parts, root_node)
+        if self._mmap and os.path.abspath(filename) == self._file:
+            # the mapped file is about to be truncated, so everything still mapped has to be copied first
+            self._root._own_data()
+            if not self._close_mapping():
+                raise Exception('views of the mapped file are still referenced, can not overwrite "{}"'.format(filename))
 
+        writer = self._root._write_to_file(filename, dedupe)
+        
+        self._layout_file = os.path.abspath(filename)
+        self._structure_changed = False
+        self._root._dirty_nodes.clear()
+        
+        return writer.deduplicated_bytes
+        
+    def _can_patch(self, filename):
+        if self._structure_changed or os.path.abspath(filename) != self._layout_file:
+            return False
+            
+        if not os.path.isfile(filename):
+            return False
+            
+        dirty_offsets = set()
+        for node in self._root._dirty_nodes:
+            if node['node_type'] != 'leaf' or len(node['data']) > node['allocated_size']:
+                return False
+            if node['allocated_size']:
+                dirty_offsets.add(node['data_block_offset'])
+            
+        # leaves may share their data with other leaves, those can only be changed by a rewrite
+        shared = 0
+        for node in self._root._get_root_node()._iter_nodes():
+            if node['node_type'] == 'leaf' and node['allocated_size'] and node['data_block_offset'] in dirty_offsets:
+                shared += 1
+                
+        return shared == len(dirty_offsets)
+        
+    def _patch_file(self, filename):
+        data_block_offset = self._root['data_block_offset']
+        
+        with open(filename, 'r+b') as file:
+            for node in self._root._dirty_nodes:
+                data = node['data']
+                node['size'] = len(data)
+                node['size2'] = node['size']
+                
+                file.seek(data_block_offset + node['data_block_offset'])
+                file.write(data)
+                file.write(bytes(node['allocated_size'] - node['size']))
+                
+                file.seek(node._offset)
+                file.write(node._pack())
+                
+        _logger.debug('patched {} nodes in "{}"'.format(len(self._root._dirty_nodes), filename))
+        self._root._dirty_nodes.clear()
+
+    def add_node(self, node_path, file_path=None, data=None):
         if file_path:
             with open(file_path, 'rb') as file:
                 data = file.read()
 
-        self._create_nodes(remaining_path, first_parent, data)
+        self.add_nodes([(node_path, data)])
+        
+    def add_nodes(self, nodes):
+        # nodes is a mapping or an iterable of (path, data), created in the given order. every path is
+        # resolved through the child name maps, so each leaf costs O(depth) no matter how wide the
+        # levels are.
+        if isinstance(nodes, dict):
+            nodes = nodes.items()
+            
+        root_node = self._root._get_root_node()
+        
+        for node_path, data in nodes:
+            parent, remaining_path = self._find_node_matching_path(node_path.split('\\')[1:], root_node)
+                
+            if not remaining_path:
+                _logger.warning(f'node "{node_path}" already exists')
+                continue
+                
+            self._create_nodes(remaining_path, parent, data)
         
-        # self.print_tree()
+    def graft(self, src_utf, src_path, dst_path=None):
+        # copies the subtree at src_path of another (or the same) UTFFile to dst_path, which defaults
+        # to the source path. both are full paths from the root, missing levels above dst_path are
+        # created. the new leaves share the payload objects of the source, nothing is copied before
+        # the next save.
+        source, remaining_path = src_utf._find_node_matching_path(
+            self._split_path(src_path), 
+            src_utf._root._get_root_node(),
+        )
+        
+        if remaining_path:
+            raise Exception('node "{}" does not exist'.format(src_path))
+            
+        if dst_path is None:
+            dst_path = source['path']
+            
+        parent, remaining_path = self._find_node_matching_path(
+            self._split_path(dst_path), 
+            self._root._get_root_node(),
+        )
+            
+        if not remaining_path:
+            raise Exception('node "{}" already exists'.format(dst_path))
+            
+        for name in remaining_path[:-1]:
+            parent = self._create_node(name, parent, 'intermediate')
+            
+        # the source subtree is listed before anything is added, so grafting into itself terminates
+        copies = {}
+        for node in list(source._iter_nodes()):
+            if node is source:
+                node_append, name = parent, remaining_path[-1]
+            else:
+                node_append, name = copies[node._parent], node['name']
+                
+            data = getattr(node, '_payload', None)
+            if isinstance(data, memoryview):
+                # a view of its own, so closing the source does not release it
+                data = data[:]
+                
+            copies[node] = self._create_node(name, node_append, node['node_type'], data)
+            
+        return True
+        
+    @staticmethod
+    def _split_path(path):
+        return [name for name in path.split('\\') if name]
         
     def _find_node_matching_path(self, path_parts, node):
-        current_search = path_parts[0]
-        ret = (node, path_parts)
-        for child in node.get_children():
-            if child['name'] == current_search:
-                ret = self._find_node_matching_path(path_parts[1:], child)
-                break
-        return ret
+        for i, name in enumerate(path_parts):
+            child = node.get_child(name)
+            if child is None:
+                return node, path_parts[i:]
+            node = child
+        return node, []
+        
+    def query(self, pattern):
+        # glob-like path patterns, e.g. '\\VMeshLibrary\\*\\VMeshData' or 'material library\\*\\Dt_name'.
+        # * ? [] match within one level, ** matches any number of levels. returns a generator.
+        segments = _compile_query(pattern, self._case_sensitive)
+        return _walk_query(self._root._get_root_node(), segments)
         
     def find_nodes_with_name_in_path(self, search_path, node=None, ret=None):
         if ret is None:
@@ -122,122 +736,148 @@ class UTFFile(object):
         return ret
         
     def _create_nodes(self, node_names, node_append, data):
-        for i, name in enumerate(node_names):
-            _logger.debug('creating node {} as child of {}'.format(name, node_append['name']))
-            node = UTFTreeNode(
-                empty=True,
-            )
-            
-            node['name'] = name
+        for name in node_names[:-1]:
+            node_append = self._create_node(name, node_append, 'intermediate')
+        self._create_node(node_names[-1], node_append, 'leaf', data)
+        
+    def _create_node(self, name, node_append, node_type, data=None):
+        _logger.debug('creating node {} as child of {}'.format(name, node_append['name']))
+        node = UTFTreeNode(
+            node_append,
+            root_node=self._root,
+            empty=True,
+        )
+        
+        node['name'] = name
+        node['node_type'] = node_type
+        
+        if node_type == 'leaf':
+            node['data'] = data
             
-            if i == len(node_names) - 1:
-                node['node_type'] = 'leaf'
-                node['data'] = data
-            else:
-                node['node_type'] = 'intermediate'
-                
-            node_append.add_child(node)
-            node_append = node      
+        node_append.add_child(node)
+        self._index_node(node)
+        self._order = None
+        self._structure_changed = True
+        return node      
 
                 
 class UTFTreeNode(object):
+    # nodes are kept for every entry of every open file, so they are slotted and the path is
+    # computed from the parent chain instead of being stored. node['name'] style access maps
+    # onto the attributes.
+    __slots__ = _node_fields + (
+        '_offset',
+        '_name',
+        '_payload',
+        '_children',
+        '_child_names',
+        '_parent',
+        '_root',
+    )
+    _keys = _node_fields + ('name', 'path', 'node_type', 'data')
     
-    def __init__(self, parent=None, offset=0, root_node=None, path='', empty=False):
+    def __init__(self, parent=None, offset=0, root_node=None, path='', empty=False, record=None):
         self._offset = offset
-        self._type = type
-        self._is_leaf = True
-        self._data = {}
-        self._children = []
+        self._children = ()
+        self._child_names = None    # name -> children with that name, in child order, see _get_child_names
         self._parent = parent
         self._root = root_node
-        self._path = path
         
         if empty:
-            self._init_empty()
+            self._init_empty(path == '__ROOT__')
         else:
-            self._load()
-            
-    def _init_empty(self):
-        self['peer_offset'] = 0
-        self['name_offset'] = 0
-        self['flags'] = 0
-        self['_null_'] = 0
-        self['data_block_offset'] = 0
-        self['allocated_size'] = 0
-        self['size'] = 0
-        self['size2'] = 0
-        self['timestamp_0'] = 0
-        self['timestamp_1'] = 0
-        self['timestamp_2'] = 0
-        
-        if self._path == '__ROOT__':
-            self['name'] = '\\'
-            self['path'] = ''
-            self['node_type'] = 'intermediate'
+            self._load(record)
+            
+    def _init_empty(self, is_root=False):
+        for field in _node_fields:
+            setattr(self, field, 0)
+        
+        if is_root:
+            self._name = '\\'
+            self.node_type = 'intermediate'
         else:
-            self['name'] = ''
-            self['path'] = self._path
+            self._name = ''
                     
-    def _load(self):
-        pos = self._offset
-        
-        self['peer_offset'], pos = self._get_int(pos)  # next (sibling) node
-        self['name_offset'], pos = self._get_int(pos)
-        self['flags'], pos = self._get_int(pos)
+    def _load(self, record=None):
+        # record can be passed in when it is already known, e.g. from the node table of the root
+        (
+            self.peer_offset,
+            self.name_offset,
+            self.flags,
+            self._null_,
+            self.data_block_offset,
+            self.allocated_size,
+            self.size,
+            self.size2,
+            self.timestamp_0,
+            self.timestamp_1,
+            self.timestamp_2,
+        ) = record if record is not None else self._root._get_node_record(self._offset)
         
-        self['_null_'], pos = self._get_int(pos)  # unknown, ask schmacki
-        
-        self['data_block_offset'], pos = self._get_int(pos)  # OR child node offset 
-        self['allocated_size'], pos = self._get_int(pos)     # leaf only
-        self['size'], pos = self._get_int(pos)               # leaf only
-        self['size2'], pos = self._get_int(pos)              # leaf only
-        
-        # more unknowns
-        self['timestamp_0'], pos = self._get_int(pos)
-        self['timestamp_1'], pos = self._get_int(pos)
-        self['timestamp_2'], pos = self._get_int(pos)
-        
-        self['name'] = self._root._load_name(self['name_offset'])
-        self['path'] = self._concat_path()
+        self._name = self._root._load_name(self.name_offset)
         
         if self._parent:
             self._parent.add_child(self)
             
-        if self['peer_offset'] > 0:
-            UTFTreeNode(
-                self._parent,
-                self._root['node_block_offset'] + self['peer_offset'],
-                self._root,
-                self._path
-            )
-            
-        if self['flags'] == 16 and self['data_block_offset'] > 0:
-            self['node_type'] = 'intermediate'
-            UTFTreeNode(
-                self, 
-                self._root['node_block_offset'] + self['data_block_offset'], 
-                self._root,
-                self['path']
-            )            
-        else:  # if self['flags'] == 128:
-            self['node_type'] = 'leaf'
-            if self['size'] != self['size2']:
+        if _is_intermediate(self.flags, self.data_block_offset):
+            self.node_type = 'intermediate'
+        else:  # if self.flags == 128:
+            self.node_type = 'leaf'
+            if self.size != self.size2:
                 _logger.warning('This might be compressed !?')
                 
-            self['data'] = self._root._load_data(
-                self['data_block_offset'], 
-                self['size'],
+            self._payload = self._root._load_data(
+                self.data_block_offset, 
+                self.size,
             )
-        # elif self['flags'] not in [16, 128]:
-        #    print('unexpected node flag: {}'.format(self['flags']))
+        # elif self.flags not in [16, 128]:
+        #    print('unexpected node flag: {}'.format(self.flags))
+        
+    @property
+    def name(self):
+        return self._name
+        
+    @name.setter
+    def name(self, name):
+        if self._parent is not None:
+            self._parent._rename_child(self, self._name, name)
+        self._name = name
+        
+    @property
+    def path(self):
+        names = []
+        node = self
+        while node._parent is not None:
+            names.append(node._name)
+            node = node._parent
             
-    def _get_int(self, read_position):
-        return self._root._get_int(read_position)
+        path = ''
+        for name in reversed(names):
+            path = _join_path(path, name)
+        return path
+        
+    @property
+    def node_type(self):
+        return 'leaf' if self.flags == 128 else 'intermediate'
+        
+    @node_type.setter
+    def node_type(self, node_type):
+        self.flags = 128 if node_type == 'leaf' else 16
+        
+    @property
+    def data(self):
+        return self._payload
+        
+    @data.setter
+    def data(self, data):
+        if self._root is not None:
+            self._root._dirty_nodes[self] = None
+        self._payload = data
             
     def save_data_to_file(self, node_name, filename='', multiple_path=False):
         if self['path'].endswith(node_name):
             # print self['path']
-            if 'data' in self._data:                
+            if 'data' in self:                
                 if multiple_path:
                     filename = multiple_path + self['path'].replace('\\', '_') + filename           
                 
@@ -259,7 +899,7 @@ class UTFTreeNode(object):
             
     def get_node_data(self, node_name, multiple=False):    
         if self['path'].endswith(node_name):
-            if 'data' in self._data: 
+            if 'data' in self: 
                 if multiple:
                     return [self]
                 else:
@@ -286,18 +926,7 @@ class UTFTreeNode(object):
             raise Exception('either filename or binary data is needed')
 
         if self['path'].endswith(node_name):
-            if self['flags'] == 128:
-                if filename:
-                    with open(filename, 'rb') as file:
-                        data = file.read()
-
-                if not isinstance(data, bytes):
-                    _logger.error('data has to be in binary format!')
-
-                self['data'] = data
-            else:
-                _logger.error('node is not a leaf!')
-                
+            self._set_data(filename, data)
             return True
         else:
             found = False
@@ -307,6 +936,19 @@ class UTFTreeNode(object):
                     break
             return found
             
+    def _set_data(self, filename=None, data=None):
+        if self['flags'] == 128:
+            if filename:
+                with open(filename, 'rb') as file:
+                    data = file.read()
+
+            if not isinstance(data, bytes):
+                _logger.error('data has to be in binary format!')
+
+            self['data'] = data
+        else:
+            _logger.error('node is not a leaf!')
+            
     def delete_node(self, node_name):
         if self['path'].endswith(node_name):
             _logger.debug('found node "{}".'.format(node_name))
@@ -319,7 +961,7 @@ class UTFTreeNode(object):
                     break
             
             if isinstance(found, UTFTreeNode):
-                self._children.remove(found)
+                self.remove_child(found)
                 found = True
             
             return found
@@ -327,45 +969,119 @@ class UTFTreeNode(object):
     def print_tree(self, depth=0):
         print('{}{} ({})'.format(
             ('-' * depth),
-            self['name'],
-            self._concat_path(),
+            self.name,
+            self.path,
         ))
         for child in self._children:
             child.print_tree(depth + 1)
                     
     def add_child(self, node):
+        if not self._children:
+            # leaves never get children, so the list is only created when needed
+            self._children = []
+            
         self._children.append(node)
+        if self._child_names is not None:
+            self._child_names.setdefault(self._name_key(node.name), []).append(node)
+        
+    def remove_child(self, node):
+        self._children.remove(node)
+        if self._child_names is not None:
+            self._unmap_child(node, node.name)
+        
+        if self._root is not None:
+            self._root._detach(node)
+        
+    def get_child(self, name):
+        child_names = self._get_child_names()
+        if not child_names:
+            return None
+            
+        children = child_names.get(self._name_key(name))
+        return children[0] if children else None
+        
+    def _get_child_names(self):
+        # loading does not look children up by name, so the map is built on the first lookup
+        if self._child_names is None and self._children:
+            self._child_names = {}
+            for child in self._children:
+                self._child_names.setdefault(self._name_key(child._name), []).append(child)
+        return self._child_names
+        
+    def _name_key(self, name):
+        if self._root is None or self._root._case_sensitive:
+            return name
+        return name.lower()
+        
+    def _unmap_child(self, node, name):
+        key = self._name_key(name)
+        children = self._child_names[key]
+        children.remove(node)
+        
+        if not children:
+            del self._child_names[key]
+            
+    def _rename_child(self, node, old_name, new_name):
+        if not self._child_names or node not in self._child_names.get(self._name_key(old_name), ()):
+            return
+            
+        self._unmap_child(node, old_name)
+        children = self._child_names.setdefault(self._name_key(new_name), [])
+        children.append(node)
+        
+        if len(children) > 1:
+            # the name is used more than once, the first child in order has to stay first
+            children.sort(key=self._children.index)
         
-    def _concat_path(self):
-        if self._path != '' and self._path != '\\':
-            return self._path + '\\' + self['name']
-        return self._path + self['name']
-                
     def get_children(self):
         return self._children
+        
+    def _pack(self):
+        return _node_struct.pack(*[getattr(self, field) for field in _node_fields])
+        
+    def _iter_nodes(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node._children))
     
     # iterator & access
     def __delitem__(self, key):
-        del self._data[key]
+        try:
+            delattr(self, '_payload' if key == 'data' else key)
+        except AttributeError:
+            raise KeyError(key)
 
     def __getitem__(self, key):
-        return self._data[key]
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
 
     def __setitem__(self, key, value):
-        if key == 'node_type':
-            self['flags'] = 128 if value == 'leaf' else 16
-        self._data[key] = value
+        setattr(self, key, value)
 
     def __iter__(self):
-        return self._data.__iter__()
+        return (key for key in self._keys if hasattr(self, key))
+
+    def __contains__(self, key):
+        return key in self._keys and hasattr(self, key)
 
 
 class UTFTreeRoot(UTFTreeNode):
-    def __init__(self, raw_data=None):
+    # not slotted, the header fields live in the instance dict
+    _keys = _header_fields + UTFTreeNode._keys
+    
+    def __init__(self, raw_data=None, case_sensitive=True):
         self._raw_len = 0
+        self._string_table = None
+        self._dirty_nodes = {}
+        self._detached_views = []   # mapped data of removed nodes, released with the mapping
+        self._case_sensitive = case_sensitive
 
         if raw_data:
-            self._raw = bytes(raw_data)
+            self._raw = raw_data if isinstance(raw_data, memoryview) else bytes(raw_data)
             self._raw_len = len(self._raw)
             super(UTFTreeRoot, self).__init__(empty=False)
         else:
@@ -379,58 +1095,58 @@ class UTFTreeRoot(UTFTreeNode):
             )
             self.add_child(self._actual_root_node)
         
-        self['name'] = 'root'
-        self['path'] = ''
+        self._name = 'root'
 
-    def _load(self):
-        pos = self._offset
-        
-        self['signature'], pos = self._get_int(pos)
-        self['version'], pos = self._get_int(pos)
+    def _load(self, record=None):
+        for field, value in zip(_header_fields, _header_struct.unpack_from(self._raw, self._offset)):
+            setattr(self, field, value)
         
-        # node chunk
-        self['node_block_offset'], pos = self._get_int(pos)
-        self['node_size'], pos = self._get_int(pos)
-                
-        self['unknown'], pos = self._get_int(pos)  # unknown, ask schmacki
+        self._load_node_table()
+        self._load_string_table()
+        self._actual_root_node = self._load_nodes()
+        # the nodes hold every field of their record, the tables are only needed for linking
+        self._node_table = []
+        self._string_table = None
         
-        # header
-        self['header_size'], pos = self._get_int(pos)
+    def _load_node_table(self):
+        # decode the whole node block in one go, the records are linked afterwards
+        start = self['node_block_offset']
+        end = min(start + self['node_size'], self._raw_len)
+        end -= (end - start) % _node_struct.size
         
-        # string block
-        self['string_block_offset'], pos = self._get_int(pos)
-        self['string_block_alloc'], pos = self._get_int(pos)  # unknown, ask schmacki
-        self['string_block_size'], pos = self._get_int(pos)     
+        self._node_table = list(_node_struct.iter_unpack(self._raw[start:end]))
         
-        # data block
-        self['data_block_offset'], pos = self._get_int(pos)
+    def _load_string_table(self):
+        start = self['string_block_offset']
+        end = min(start + self['string_block_size'], self._raw_len)
         
-        # unknown, ask schmacki
-        self['unknown2'], pos = self._get_int(pos)            
+        self._string_table = _decode_string_block(self._raw[start:end])
         
-        # whatever date information might be in there...
-        self['timestamp_0'], pos = self._get_int(pos)
-        self['timestamp_1'], pos = self._get_int(pos)
-        self['timestamp_2'], pos = self._get_int(pos)       
+    def _get_node_record(self, offset):
+        block_offset = self['node_block_offset']
+        return _read_node_record(self._node_table, self._raw, block_offset, offset - block_offset)
         
-        self['path'] = ''
+    def _load_nodes(self):
+        block_offset = self['node_block_offset']
+        node_table = self._node_table
         
-        self._actual_root_node = UTFTreeNode(
-            self, 
-            self['node_block_offset'],
+        return _walk_node_links(
+            lambda offset: _read_node_record(node_table, self._raw, block_offset, offset),
             self,
-        )       
+            lambda parent, offset, record: UTFTreeNode(parent, block_offset + offset, self, record=record),
+        )
          
     def _load_data(self, data_offset, data_size):
         start = data_offset + self['data_block_offset']
         end = start + data_size
         return self._raw[start:end]
     
-    def _get_int(self, read_position):
-        data = struct.unpack('I', self._raw[read_position:read_position+4])
-        return data[0], read_position + 4
-    
     def _load_name(self, name_offset):
+        name = self._string_table.get(name_offset) if self._string_table else None
+        if name is not None:
+            return name
+            
+        # not the start of a string in the block, e.g. the tail of another name
         offset = self['string_block_offset'] + name_offset
         
         char = 'x'
@@ -448,31 +1164,69 @@ class UTFTreeRoot(UTFTreeNode):
     def _get_root_node(self):
         return self._actual_root_node
         
-    def _write_to_file(self, filename):
-        writer = UTFWriter(self, filename)
+    def _name_key(self, name):
+        return name if self._case_sensitive else name.lower()
+        
+    def remove_child(self, node):
+        # the root is not its own _root, so UTFTreeNode.remove_child can not detach its children
+        UTFTreeNode.remove_child(self, node)
+        self._detach(node)
+        
+    def _detach(self, node):
+        # a removed subtree is not reachable for _release_data anymore, but its leaves keep the
+        # mapping exported until their data is released
+        if isinstance(getattr(self, '_raw', None), memoryview):
+            self._detached_views.extend(
+                child._payload for child in node._iter_nodes() 
+                if isinstance(getattr(child, '_payload', None), memoryview)
+            )
+            
+    def _own_data(self):
+        for node in self._iter_nodes():
+            if isinstance(getattr(node, '_payload', None), memoryview):
+                node._payload = bytes(node._payload)
+                
+    def _release_data(self):
+        for node in self._iter_nodes():
+            if isinstance(getattr(node, '_payload', None), memoryview):
+                node._payload.release()
+                
+        for view in self._detached_views:
+            view.release()
+        self._detached_views.clear()
+                
+        if isinstance(self._raw, memoryview):
+            self._raw.release()
+        
+    def _write_to_file(self, filename, dedupe=False):
+        writer = UTFWriter(self, filename, dedupe)
         writer.save()
+        return writer
 
 
 class UTFWriter(object):
-    def __init__(self, tree, filename):
+    def __init__(self, tree, filename, dedupe=False):
         self._tree = tree
         self._filename = filename
         
-        self._name_offsets = {}
+        # identical payloads are written once and shared by all their leaves
+        self._dedupe = dedupe
+        self._payloads = {}
+        self._shared_nodes = set()
+        self.deduplicated_bytes = 0
         
-        self._node_block = b''
-        self._string_block = b''
-        self._data_block = b''
+        self._name_offsets = {}
+        self._string_parts = []
+        self._string_block_length = 0
         
         self._write_nodes = []
-        self._node_block_length = 0     
+        self._node_block_length = 0
+        self._data_block_length = 0
         
     def save(self): 
+        # first pass: lay out all blocks, nothing but the node records is held in memory
         self._prepare_nodes(self._tree)
         
-        for node in self._write_nodes:
-            self._node_block += self._pack_node(node)
-        
         self._tree['signature'] = 541480021     # fixed 
         self._tree['version'] = 257             # fixed 
         self._tree['header_size'] = 44          # fixed 
@@ -484,113 +1238,123 @@ class UTFWriter(object):
         self._tree['unknown'] = 0
         self._tree['unknown2'] = 0
         
-        self._tree['node_size'] = len(self._node_block)
+        self._tree['node_size'] = self._node_block_length
         
         self._tree['string_block_offset'] = self._tree['node_block_offset'] + self._tree['node_size']
-        self._tree['string_block_size'] = len(self._string_block) + 1
+        self._tree['string_block_size'] = self._string_block_length + 1
         self._tree['string_block_alloc'] = (self._tree['string_block_size'] + 7) & ~7
         self._tree['data_block_offset'] = self._tree['string_block_offset'] + self._tree['string_block_alloc']
 
-        self._raw = self._pack_header(self._tree)
-        self._raw += self._node_block
-        self._raw += self._string_block
-        self._raw += b'\x00'
-        
-        for i in range(self._tree['string_block_size'], self._tree['string_block_alloc']):
-            self._raw += b'\x00'
-        
-        self._raw += self._data_block
-                        
+        # second pass: stream everything to the file, leaf payloads are never concatenated
         with open(self._filename, 'wb') as file:
-            file.write(self._raw)
+            file.write(self._pack_header(self._tree))
+            file.write(self._pack_node_block())
+            file.writelines(self._string_parts)
+            file.write(bytes(self._tree['string_block_alloc'] - self._string_block_length))
+            file.writelines(self._iter_data_block())
+            
+        if self._dedupe:
+            _logger.info('deduplication saved {} bytes in "{}"'.format(self.deduplicated_bytes, self._filename))
         
     def _add_node(self, node):
         node['name_offset'] = self._pack_string(node['name'])
         
         if node['node_type'] == 'leaf':
-            node['data_block_offset'] = len(self._data_block)
+            node['data_block_offset'] = self._data_block_length
                                     
             node['size'] = len(node['data'])
             node['size2'] = node['size']
             node['allocated_size'] = (node['size'] + 3) & ~ 3
 
-            self._data_block += node['data']
-            
-            for i in range(node['size'], node['allocated_size']):
-                self._data_block += b'\x00'
+            if self._dedupe and node['size'] and self._share_payload(node):
+                return
+
+            self._data_block_length += node['allocated_size']
         else:
             node['size'] = 0
             node['size2'] = 0
             node['allocated_size'] = 0
-                        
-    def _prepare_nodes(self, current_node):
-        children = current_node.get_children()
-                
-        prev_node = None
-        for node in children:
-            node['peer_offset'] = 0
-            node_offset = self._node_block_length
-            self._node_block_length += 4 * 11
-            self._write_nodes.append(node)
-                        
-            if prev_node:
-                prev_node['peer_offset'] = node_offset
-            elif current_node['name'] != 'root':
-                # no previous: first child node
-                current_node['data_block_offset'] = node_offset
             
-            self._add_node(node)    
-            prev_node = node    
+    def _share_payload(self, node):
+        key = hashlib.sha1(node['data']).digest()
+        first = self._payloads.get(key)
+        
+        if first is None or first['data'] != node['data']:
+            self._payloads.setdefault(key, node)
+            return False
             
-        for node in children:
-            if len(node.get_children()) > 0:
-                self._prepare_nodes(node)       
+        node['data_block_offset'] = first['data_block_offset']
+        self._shared_nodes.add(node)
+        self.deduplicated_bytes += node['allocated_size']
+        return True
+        
+    def _iter_data_block(self):
+        for node in self._write_nodes:
+            if node['node_type'] == 'leaf' and node not in self._shared_nodes:
+                yield memoryview(node['data'])
+                
+                if node['allocated_size'] > node['size']:
+                    yield bytes(node['allocated_size'] - node['size'])
+                        
+    def _prepare_nodes(self, tree):
+        # every node's children are written as one consecutive run of records, the runs
+        # themselves are ordered depth-first
+        stack = [tree]
+        
+        while stack:
+            current_node = stack.pop()
+            children = current_node.get_children()
+                
+            prev_node = None
+            for node in children:
+                node['peer_offset'] = 0
+                node_offset = self._node_block_length
+                self._node_block_length += _node_struct.size
+                self._write_nodes.append(node)
+                            
+                if prev_node:
+                    prev_node['peer_offset'] = node_offset
+                elif current_node['name'] != 'root':
+                    # no previous: first child node
+                    current_node['data_block_offset'] = node_offset
+                
+                self._add_node(node)    
+                prev_node = node    
+                
+            stack.extend(node for node in reversed(children) if len(node.get_children()) > 0)
             
     def _pack_string(self, string):
+        # keyed by the name as well as its encoding, names loaded from a file are interned and
+        # mostly shared, so repeated ones are neither encoded nor hashed again
+        ret = self._name_offsets.get(string)
+        if ret is not None:
+            return ret
+            
         name = (string if isinstance(string, bytes) else string.encode('UTF-8')) + b'\x00'
 
         if name in self._name_offsets:
             ret = self._name_offsets[name]
         else:
-            ret = len(self._string_block)
-            self._string_block += name
+            ret = self._string_block_length
+            self._string_parts.append(name)
+            self._string_block_length += len(name)
             self._name_offsets[name] = ret
 
+        self._name_offsets[string] = ret
         return ret
-                
-    @staticmethod
-    def _pack_node(node):
-        return struct.pack(
-            'I' * 11,
-            node['peer_offset'],
-            node['name_offset'],
-            node['flags'],
-            node['_null_'],
-            node['data_block_offset'],
-            node['allocated_size'],
-            node['size'],
-            node['size2'],
-            node['timestamp_0'],
-            node['timestamp_1'],
-            node['timestamp_2'],
-        )
+        
+    def _pack_node_block(self):
+        node_block = bytearray(self._node_block_length)
+        
+        for index, node in enumerate(self._write_nodes):
+            block_offset = index * _node_struct.size
+            node_block[block_offset:block_offset + _node_struct.size] = node._pack()
+            
+            # keeps the nodes in sync with the written file, for later in place saves
+            node._offset = self._tree['node_block_offset'] + block_offset
+            
+        return node_block
     
     @staticmethod
     def _pack_header(node):
-        return struct.pack(
-            'I' * 14,
-            node['signature'],
-            node['version'],
-            node['node_block_offset'],
-            node['node_size'],
-            node['unknown'],
-            node['header_size'],
-            node['string_block_offset'],
-            node['string_block_alloc'],
-            node['string_block_size'],
-            node['data_block_offset'],
-            node['unknown2'],
-            node['timestamp_0'],
-            node['timestamp_1'],
-            node['timestamp_2']
-        )
+        return _header_struct.pack(*[node[field] for field in _header_fields])
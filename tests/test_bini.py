@@ -0,0 +1,64 @@
+from pyfl_utils.bini import BINI, BINIWriter
+from pyfl_utils.inifile import INIFile
+
+
+def _entry(name, *values):
+    return {'name': name, 'values': [BINI.VALUE(value_type, value) for value_type, value in values]}
+
+
+def test_writer_round_trip():
+    sections = [
+        {'name': 'Ship', 'entries': [
+            _entry('nickname', (0x03, 'li_elite')),
+            _entry('limits', (0x01, 0x7fffffff), (0x01, -0x80000000), (0x01, 0)),
+            _entry('scale', (0x02, 0.5), (0x02, -1.25)),
+            _entry('ids_info', (0x03, 'Zoë'), (0x03, '')),
+            _entry('flag'),
+        ]},
+        {'name': 'Ship', 'entries': [_entry('nickname', (0x03, 'li_elite'))]},
+        {'name': 'Empty', 'entries': []},
+    ]
+
+    assert BINI(BINIWriter(sections).encode()).get_sections() == sections
+
+
+def test_writer_replaces_characters_outside_latin_1():
+    sections = [{'name': 'Ship', 'entries': [_entry('ids_info', (0x03, 'Zoë Ω'))]}]
+
+    decoded = BINI(BINIWriter(sections).encode()).get_sections()
+
+    assert decoded[0]['entries'][0]['values'] == [BINI.VALUE(0x03, 'Zoë ?')]
+
+
+def test_values_from_string_keeps_ints_in_int32_range():
+    assert BINIWriter.values_from_string('2147483647, -2147483648') == [
+        BINI.VALUE(0x01, 2147483647),
+        BINI.VALUE(0x01, -2147483648),
+    ]
+    assert BINIWriter.values_from_string('2147483648') == [BINI.VALUE(0x02, 2147483648.0)]
+    assert BINIWriter.values_from_string('') == []
+
+
+def test_binary_save_round_trip(tmp_path):
+    path = tmp_path / 'ships.ini'
+    path.write_bytes(
+        b'[Ship]\r\n'
+        b'nickname = li_elite\r\n'
+        b'limits = 2147483647, -2147483648\r\n'
+        b'scale = 0.5\r\n'
+        b'fuse = a, 1, b ; comment\r\n'
+        b'[Ship]\r\n'
+        b'nickname = li_fighter\r\n'
+    )
+
+    ini = INIFile(str(path))
+    ini.save(binary=True)
+    assert path.read_bytes().startswith(b'BINI')
+
+    saved = INIFile(str(path))
+    assert [section.to_raw() for section in saved.to_list()] == [section.to_raw() for section in ini.to_list()]
+
+    ship = saved.get_by_kv('nickname', 'li_elite', multiple=False)
+    assert ship.get_typed('limits') == (2147483647, -2147483648)
+    assert ship.get_typed('scale') == (0.5,)
+    assert ship.get_typed('fuse') == ('a', 1, 'b')
@@ -0,0 +1,138 @@
+import pytest
+
+from pyfl_utils.inifile import INIFile, IniSection
+
+
+_SYSTEM = (
+    b'[Object]\r\n'
+    b'nickname = planet\r\n'
+    b'archetype = planet_earth\r\n'
+    b'[Zone]\r\n'
+    b'nickname = zone_a\r\n'
+    b'[Object]\r\n'
+    b'nickname = station\r\n'
+    b'archetype = station_big\r\n'
+    b'[Object]\r\n'
+    b'nickname = wreck\r\n'
+    b'archetype = planet_earth\r\n'
+)
+
+
+def _system(tmp_path, indexed):
+    path = tmp_path / 'system.ini'
+    path.write_bytes(_SYSTEM)
+    ini = INIFile(str(path))
+    if indexed:
+        ini.add_index('nickname')
+        ini.add_index('archetype')
+    return ini
+
+
+def _nicknames(sections):
+    return [section.get('nickname') for section in sections]
+
+
+def test_index_follows_set(tmp_path):
+    ini = _system(tmp_path, indexed=True)
+    old_zone = ini.get('zone')
+
+    zone = IniSection('Zone')
+    zone.add('nickname', 'zone_b')
+    ini.set(zone)
+
+    assert ini.get_by_kv('nickname', 'zone_a') == []
+    assert ini.get_by_kv('nickname', 'zone_b') == [zone]
+
+    # the replaced section is not indexed anymore, the new one is
+    old_zone.set('nickname', 'ghost')
+    zone.set('nickname', 'zone_c')
+    assert ini.get_by_kv('nickname', 'ghost') == []
+    assert ini.get_by_kv('nickname', 'zone_c') == [zone]
+
+    # set replaces every section of the name
+    planet = IniSection('Object')
+    planet.add('nickname', 'planet')
+    ini.set(planet)
+    assert ini.get_by_kv('archetype', 'planet_earth') == []
+    assert _nicknames(ini.get_by_key('nickname')) == ['planet', 'zone_c']
+
+
+def test_index_follows_rem(tmp_path):
+    ini = _system(tmp_path, indexed=True)
+    station = ini.get_by_kv('nickname', 'station', multiple=False)
+
+    ini.rem(station)
+    assert ini.get_by_kv('nickname', 'station') == []
+    assert _nicknames(ini.get_by_key('archetype')) == ['planet', 'wreck']
+
+    station.set('archetype', 'planet_earth')
+    assert _nicknames(ini.get_by_kv('archetype', 'planet_earth')) == ['planet', 'wreck']
+
+    ini.rem('Zone')
+    assert ini.get_by_kv('nickname', 'zone_a') == []
+
+    ini.rem_by_kv('archetype', 'PLANET_EARTH')
+    assert _nicknames(ini.get_by_key('nickname')) == ['wreck']
+
+
+def test_indexed_lookups_match_scans(tmp_path):
+    scanned = _system(tmp_path, indexed=False)
+    indexed = _system(tmp_path, indexed=True)
+
+    for ini in (scanned, indexed):
+        ini.rem(ini.get_by_kv('nickname', 'planet', multiple=False))
+        ini.get_by_kv('nickname', 'wreck', multiple=False).set('nickname', 'Station')
+
+        added = IniSection('Object')
+        added.add('nickname', 'station')
+        ini.add(added)
+
+        zone = IniSection('zone')
+        zone.add('archetype', 'station_big')
+        ini.set(zone)
+
+    for key, value in (('nickname', 'station'), ('archetype', 'station_big'), ('archetype', 'planet_earth')):
+        assert _nicknames(indexed.get_by_kv(key, value)) == _nicknames(scanned.get_by_kv(key, value))
+        assert (
+            _nicknames(indexed.get_by_kv(key, value, case_sensitive=True)) ==
+            _nicknames(scanned.get_by_kv(key, value, case_sensitive=True))
+        )
+    assert _nicknames(indexed.get_by_key('nickname')) == _nicknames(scanned.get_by_key('nickname'))
+    assert _nicknames(indexed.get_by_key('archetype')) == _nicknames(scanned.get_by_key('archetype'))
+
+
+def test_save_writes_every_section(tmp_path):
+    ini = _system(tmp_path, indexed=False)
+    ini.get('zone').add('visit', 128)
+    ini.save()
+
+    path = tmp_path / 'system.ini'
+    assert path.read_bytes() == b''.join(section.to_raw().encode('cp1252') for section in ini.to_list())
+    assert b'visit = 128\r\n' in path.read_bytes()
+    assert [entry.name for entry in tmp_path.iterdir()] == ['system.ini']
+
+
+def test_failed_save_keeps_the_old_file(tmp_path):
+    path = tmp_path / 'system.ini'
+    ini = _system(tmp_path, indexed=False)
+
+    # not encodable in cp1252, the write fails in the middle of the file
+    ini.get('zone').set('ids_info', 'Ω')
+    with pytest.raises(UnicodeEncodeError):
+        ini.save()
+
+    assert path.read_bytes() == _SYSTEM
+    assert [entry.name for entry in tmp_path.iterdir()] == ['system.ini']
+
+
+def test_failed_binary_save_keeps_the_old_file(tmp_path):
+    path = tmp_path / 'system.ini'
+    ini = _system(tmp_path, indexed=False)
+
+    # more values than a BINI entry can hold
+    ini.get('zone').set('pos', ', '.join(['1'] * 200))
+    with pytest.raises(Exception, match='too many values'):
+        ini.save(binary=True)
+
+    assert path.read_bytes() == _SYSTEM
+    assert [entry.name for entry in tmp_path.iterdir()] == ['system.ini']
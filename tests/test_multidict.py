@@ -0,0 +1,34 @@
+from pyfl_utils.multidict import OrderedMultiDict
+
+
+def test_values_keep_insertion_order():
+    options = OrderedMultiDict([('a', 1), ('b', 2), ('a', 3)])
+
+    assert options.get('a') == [1, 3]
+    assert options.get('b') == 2
+    assert options.get('c') is None
+    assert options.get_first('a') == 1
+    assert list(options.get_values('b')) == [2]
+    assert list(options.items()) == [('a', 1), ('b', 2), ('a', 3)]
+    assert list(options.keys()) == ['a', 'b']
+    assert len(options) == 3
+
+
+def test_removals_keep_lookups_and_order():
+    options = OrderedMultiDict((key, value) for value in range(10) for key in ('a', 'b', 'c'))
+
+    options.remove('a', 3)
+    del options['c']
+    options.replace('b', ['x', 'y'])
+
+    assert options.get_all('a') == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert options.get_all('b') == ['x', 'y']
+    assert 'c' not in options
+    assert len(options) == 11
+    assert list(options.items())[:5] == [('a', 0), ('b', 'x'), ('a', 1), ('b', 'y'), ('a', 2)]
+
+    options.add('c', 'z')
+    options.remove('a', 0)
+    assert options.get_first('a') == 1
+    assert list(options.values())[-1] == 'z'
+    assert options.positions('c') == [len(options) - 1]
@@ -0,0 +1,99 @@
+import os
+
+from pyfl_utils.utf import UTFFile, _node_struct
+
+
+def _write_library(path, textures):
+    utf = UTFFile()
+    for name, data in textures.items():
+        utf.add_node('\\Texture library\\{}\\MIP0'.format(name), data=data)
+    utf.save(str(path))
+
+
+def _read(path, node_name):
+    return bytes(UTFFile(str(path)).get_node_data(node_name)['data'])
+
+
+def test_in_place_save_only_writes_the_changed_leaf(tmp_path):
+    path = tmp_path / 'library.txm'
+    _write_library(path, {'a.tga': b'abcdefgh', 'b.tga': b'12345678'})
+    before = path.read_bytes()
+
+    utf = UTFFile(str(path))
+    node = utf.get_node_data('\\Texture library\\a.tga\\MIP0')
+    node['data'] = b'xyz'
+    utf.save(in_place=True)
+    after = path.read_bytes()
+
+    assert len(after) == len(before)
+    assert _read(path, '\\Texture library\\a.tga\\MIP0') == b'xyz'
+    assert _read(path, '\\Texture library\\b.tga\\MIP0') == b'12345678'
+
+    # nothing but the leaf's data and its node record differ
+    data_start = utf._root['data_block_offset'] + node['data_block_offset']
+    changed = set(range(data_start, data_start + node['allocated_size']))
+    changed.update(range(node._offset, node._offset + _node_struct.size))
+    assert [i for i in range(len(after)) if after[i] != before[i] and i not in changed] == []
+
+
+def test_in_place_save_rewrites_when_the_data_does_not_fit(tmp_path):
+    path = tmp_path / 'library.txm'
+    _write_library(path, {'a.tga': b'abcd', 'b.tga': b'1234'})
+
+    utf = UTFFile(str(path))
+    utf.get_node_data('\\Texture library\\a.tga\\MIP0')['data'] = b'x' * 100
+    utf.save(in_place=True)
+
+    assert os.path.getsize(str(path)) > 100
+    assert _read(path, '\\Texture library\\a.tga\\MIP0') == b'x' * 100
+    assert _read(path, '\\Texture library\\b.tga\\MIP0') == b'1234'
+
+
+def test_in_place_save_rewrites_after_adding_nodes(tmp_path):
+    path = tmp_path / 'library.txm'
+    _write_library(path, {'a.tga': b'abcd'})
+
+    utf = UTFFile(str(path))
+    utf.add_node('\\Texture library\\b.tga\\MIP0', data=b'1234')
+    utf.save(in_place=True)
+
+    assert _read(path, '\\Texture library\\a.tga\\MIP0') == b'abcd'
+    assert _read(path, '\\Texture library\\b.tga\\MIP0') == b'1234'
+
+
+def test_dedupe_writes_identical_payloads_once(tmp_path):
+    textures = {'a.tga': b'same data', 'b.tga': b'same data', 'c.tga': b'other'}
+    utf = UTFFile()
+    for name, data in textures.items():
+        utf.add_node('\\Texture library\\{}\\MIP0'.format(name), data=data)
+
+    plain_path = tmp_path / 'plain.txm'
+    deduped_path = tmp_path / 'deduped.txm'
+    assert utf.save(str(plain_path)) == 0
+    saved = utf.save(str(deduped_path), dedupe=True)
+
+    # the payload is padded to 12 bytes
+    assert saved == 12
+    assert os.path.getsize(str(plain_path)) - os.path.getsize(str(deduped_path)) == saved
+
+    deduped = UTFFile(str(deduped_path))
+    a = deduped.get_node_data('\\Texture library\\a.tga\\MIP0')
+    b = deduped.get_node_data('\\Texture library\\b.tga\\MIP0')
+    assert a['data_block_offset'] == b['data_block_offset']
+    for name, data in textures.items():
+        assert bytes(deduped.get_node_data('\\Texture library\\{}\\MIP0'.format(name))['data']) == data
+
+
+def test_in_place_save_rewrites_shared_payloads(tmp_path):
+    path = tmp_path / 'library.txm'
+    utf = UTFFile()
+    utf.add_node('\\Texture library\\a.tga\\MIP0', data=b'same')
+    utf.add_node('\\Texture library\\b.tga\\MIP0', data=b'same')
+    utf.save(str(path), dedupe=True)
+
+    utf = UTFFile(str(path))
+    utf.get_node_data('\\Texture library\\a.tga\\MIP0')['data'] = b'diff'
+    utf.save(in_place=True)
+
+    assert _read(path, '\\Texture library\\a.tga\\MIP0') == b'diff'
+    assert _read(path, '\\Texture library\\b.tga\\MIP0') == b'same'